@@ -1,91 +1,111 @@
+from itertools import permutations
+from pandas import DataFrame, Series, concat
+from numpy import zeros, unique, arange, intersect1d, array, repeat, concatenate, argsort, split, cumsum
+from functools import reduce
+from database import ec_pattern, padded_ec
 import re
 
+# the enzyme and reference columns of the curated datasets, where the TECRDB scrapes use the Enzyme: and Reference ID: columns
+dataset_columns = {'noor': ('enzyme_name', 'reference'), 'du': ('Reaction', 'Reference_id')}
+tecrdb_columns = ('Enzyme:', 'Reference ID:')
 
+# homogenize the enzyme names and the reference codes, without the datum suffix of the TECRDB reference IDs
+def normalize_enzymes(enzymes):
+    return enzymes.astype(str).str.strip().str.lower().str.replace(r'\s+', ' ', regex = True)
+
+def normalize_references(references):
+    references = references.dropna().astype(str).str.strip()
+    return references[references != ''].str.replace('_.+', '', regex = True)
 
 class comparison():
-    def __init__(self, scraping_1, scraping_2, scraping_3):
-        self.scraping_1 = scraping_1
-        self.scraping_2 = scraping_2
-        self.scraping_3 = scraping_3
-        
-        for scraping in [scraping_1, scraping_2, scraping_3]:
-            if 'noor' in scraping:
-                self.noor_enzymes = set(list(scraping['noor']['enzyme_name']))
-                self.noor_references = set(list(scraping['noor']['reference']))
-            elif 'du' in scraping:
-                self.du_enzymes = set(list(scraping['du']['Reaction']))
-                self.du_references = set(list(scraping['du']['Reference_id']))
-            elif 'freiburger' in scraping:
-                self.freiburger_enzymes = set()
-                for enzymes in [df['Enzyme:'] for df in list(scraping.values())]:
-                    for enzyme in enzymes:
-                        enzyme = str(enzyme).strip()
-                        self.freiburger_enzymes.add(enzyme)
-                    
-                self.freiburger_references = set()
-                for references in [df['Reference ID:'] for df in list(scraping.values())]:
-                    for reference in references: 
-                        if reference not in [' ']:
-                            substituted_reference = re.sub('_.+', '', str(reference))
-                            self.freiburger_references.add(substituted_reference)
-                
-    def three_way_comparison(self, analysis):
-        comparisons = {}
-        
-        if analysis == 'enzymes':
-            set_1 = self.noor_enzymes
-            set_2 = self.du_enzymes
-            set_3 = self.freiburger_enzymes
-        elif analysis == 'references':
-            set_1 = self.noor_references
-            set_2 = self.du_references
-            set_3 = self.freiburger_references
+    def __init__(self, *scrapings):
+        # each scraping maps the names of its datasets to a dataframe, or to a list of dataframes that are pooled
+        self.enzymes, self.references = {}, {}
+        for scraping in scrapings:
+            for name, dfs in scraping.items():
+                dfs = dfs if isinstance(dfs, (list, tuple)) else [dfs]
+                enzyme_column, reference_column = dataset_columns.get(name, tecrdb_columns)
+                self.enzymes[name] = unique(normalize_enzymes(concat([df[enzyme_column] for df in dfs])).to_numpy(str))
+                self.references[name] = unique(normalize_references(concat([df[reference_column] for df in dfs])).to_numpy(str))
+        self.sources = list(self.enzymes)
+
+    def membership(self, analysis):
+        # the boolean matrix of each distinct enzyme or reference in each source
+        sets = self.enzymes if analysis == 'enzymes' else self.references
+        elements, inverse = unique(concatenate([values for values in sets.values()]), return_inverse = True)
+        matrix = zeros((len(elements), len(sets)), dtype = bool)
+        matrix[inverse, repeat(arange(len(sets)), [len(values) for values in sets.values()])] = True
+        return DataFrame(matrix, index = elements, columns = list(sets))
+
+    def upset(self, analysis):
+        # the exclusive intersections of each combination of sources, from the bitmask of the membership matrix
+        matrix = self.membership(analysis)
+        bitmasks = matrix.to_numpy() @ (1 << arange(len(matrix.columns)))
+        combinations, inverse, counts = unique(bitmasks, return_inverse = True, return_counts = True)
+        intersections = DataFrame((combinations[:, None] >> arange(len(matrix.columns))) & 1 == 1, columns = matrix.columns)
+        intersections['count'] = counts
+        intersections['elements'] = [elements.tolist() for elements in split(matrix.index.to_numpy()[argsort(inverse, kind = 'stable')], cumsum(counts)[:-1])]
+        return intersections.sort_values('count', ascending = False, ignore_index = True)
+
+    def intersection(self, analysis, sources = None):
+        # the elements that are shared by all of the sources
+        matrix = self.membership(analysis)
+        return set(matrix.index[matrix[sources or self.sources].all(axis = 1)])
+
+    def set_differences(self, analysis):
+        # the elements of each source that are absent from each other source
+        matrix = self.membership(analysis)
+        return {f'{source_1}, not in {source_2}': set(matrix.index[matrix[source_1] & ~matrix[source_2]]) for source_1, source_2 in permutations(self.sources, 2)}
 
-        comparisons['noor, not in du'] = set_1 - set_2
-        comparisons['noor, not in freiburger'] = set_1 - set_3
-        comparisons['du, not in noor'] = set_2 - set_1
-        comparisons['du, not in freiburger'] = set_2 - set_3
-        comparisons['freiburger, not in noor'] = set_3 - set_1
-        comparisons['freiburger, not in du'] = set_3 - set_2  
+    def three_way_comparison(self, analysis):
+        return self.set_differences(analysis)
 
-        return comparisons
-    
     def bigg_comparison(self, bigg_model_json, master_file):
-        # parse the JSON file for reaction EC values
-        undescribed_enzymes = {}
-        master_enzymes = list(master_file['Enzyme:'])
-        total_data_points = []
-        for key, value in bigg_model_json.items():
-            if key == 'reactions':
-                for enzyme in value:
-                    for key2, value2 in enzyme.items():
-                        if key2 == 'name':
-                            enzyme_name = value2
-                        if key2 == 'annotation':
-                            for source, content in value2.items(): 
-                                if source == 'ec-code':
-                                    ecs = content
-                                    print(enzyme_name, '\t', ecs)
-                                    # investigate the master_file for the EC values
-                                    enzyme_data_count = 0
-                                    for ec in ecs:
-                                        mask = master_file['EC Value:'].str.contains(ec)
-                                        try:
-                                            enzyme_data_count += mask.value_counts()[True]
-                                        except:
-                                            pass
-                                    print(enzyme_data_count)
-                                    if enzyme_data_count == 0:
-                                        for enz in master_enzymes:
-                                            if re.search(enzyme_name.strip(), str(enz).strip(), re.IGNORECASE):
-                                                enzyme_data_count += 1
-                                        if enzyme_data_count == 0:
-                                            undescribed_enzymes[enzyme_name] = ecs
-                                        print(enzyme_data_count)
-                                    total_data_points.append(enzyme_data_count)
-                                    
-        print('\n\nundescribed_enzymes', undescribed_enzymes)
-        print('\ntotal_enzymes:', len(bigg_model_json['reactions']))
-        print('described_enzymes:', len(bigg_model_json['reactions']) - len(undescribed_enzymes))
-        print('total data points:', sum(total_data_points))
-        print('average datums per enzyme:', sum(total_data_points) / len(total_data_points))
+        # the datums of each BiGG reaction, by its EC codes or else by the tokens of its name
+        if getattr(self, '_indexed', None) is not master_file:
+            self.enzyme_index, self._indexed = enzyme_index(master_file), master_file
+        results = []
+        for reaction in bigg_model_json['reactions']:
+            ecs = reaction.get('annotation', {}).get('ec-code', [])
+            rows, match = self.enzyme_index.ec_rows(ecs), 'EC'
+            if len(rows) == 0:
+                rows, match = self.enzyme_index.name_rows(reaction.get('name', '')), 'name'
+            results.append({
+                'reaction': reaction.get('id'), 'name': reaction.get('name'), 'ec-code': ecs,
+                'match': match if len(rows) else None, 'rows': master_file.index[rows].tolist(), 'datums': len(rows)
+                })
+        results = DataFrame(results, columns = ['reaction', 'name', 'ec-code', 'match', 'rows', 'datums'])
+        print(f"{(results['datums'] > 0).sum()}/{len(results)} reactions are described by {results['datums'].sum()} datums")
+        return results
+
+class enzyme_index():
+    def __init__(self, master_file):
+        # the row positions of each exact and wildcard EC code, like 2.7.3.3, 2.7.3.-, 2.7.-.-, and 2.-.-.-
+        ecs = master_file['EC Value:'].reset_index(drop = True).fillna('').astype(str).str.findall(ec_pattern).explode().dropna()
+        parts = ecs.str.split('.', expand = True).reindex(columns = range(4)).fillna('-')
+        keys, prefix = [], parts[0]
+        for level in range(1, 4):
+            keys.append(prefix + '.-'*(4-level))
+            prefix = prefix+'.'+parts[level]
+        keys.append(prefix)
+        self.ecs = self._postings(concat(keys), Series(ecs.index.tolist()*4))
+
+        # the row positions of each token of the enzyme names
+        tokens = normalize_enzymes(master_file['Enzyme:'].reset_index(drop = True)).str.findall('[a-z0-9]+').explode().dropna()
+        self.tokens = self._postings(tokens, Series(tokens.index, index = tokens.index))
+
+    @staticmethod
+    def _postings(keys, positions):
+        return {key: unique(rows) for key, rows in DataFrame({'key': keys.to_numpy(), 'row': positions.to_numpy()}).groupby('key')['row']}
+
+    def ec_rows(self, ecs):
+        # EC codes are matched exactly, where the dashes of partial codes match any number
+        ecs = [padded_ec(ec) for ec in ecs]
+        return unique(concatenate([self.ecs.get(ec, array([], dtype = int)) for ec in ecs] + [array([], dtype = int)]))
+
+    def name_rows(self, name):
+        # the rows whose enzyme name contains every token of the name
+        tokens = re.findall('[a-z0-9]+', str(name).lower())
+        if not tokens:
+            return array([], dtype = int)
+        return reduce(intersect1d, [self.tokens.get(token, array([], dtype = int)) for token in tokens])
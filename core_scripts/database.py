@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+An embedded SQLite store of the merged TECRDB, with indexes for the lookups of the services
+"""
+from pandas import read_sql_query, DataFrame
+from storage import typed_frame, read_table, load_dataset, qualifier
+import sqlite3, os
+
+# the queryable fields of the merged table, renamed as SQL identifiers
+fields = {
+    'EC Value:': 'ec', 'Enzyme:': 'enzyme', 'Reference ID:': 'reference_id', 'KEGG Reaction:': 'kegg',
+    'T [K]': 'temperature', 'pH': 'ph', 'Keq': 'keq'
+    }
+# the verbatim text of the approximate and non-numeric temperatures, pH, and Keq values
+fields.update({column+qualifier: field+'_qualifier' for column, field in fields.items() if field in ['temperature', 'ph', 'keq']})
+indexes = ['ec', 'enzyme COLLATE NOCASE', 'reference_id', 'kegg', 'temperature', 'ph']
+# the complete and partial EC codes, like 2.7.3.2 and 2.7.3.-, where the bare numbers are not codes
+ec_pattern = r'\d+(?:\.(?:\d+|-)){1,3}'
+
+# complete the EC codes of fewer than four numbers with dashes, like 4.1.2 as 4.1.2.-
+def padded_ec(ec):
+    return ec.strip()+'.-'*(3-ec.strip().count('.'))
+
+def build_database(merged, database_path = os.path.join('TECRDB', 'merged_TECRDB.sqlite')):
+    # load the merged table, or the path of its Parquet or CSV export, into a new database that replaces the previous one
+    if isinstance(merged, str):
+        merged = read_table(merged, typed = False) if not merged.endswith('.csv') else load_dataset(merged, dtype = 'object', index_col = 0)
+    datums = typed_frame(merged.reset_index(drop = True)).rename(columns = fields)
+    for column in datums.select_dtypes(exclude = 'number'):
+        values = datums[column].str.strip()
+        datums[column] = values.where(values != '')
+    datums.insert(0, 'datum', range(len(datums)))
+
+    # each EC code of the datums with several enzymes, like 4.3.1.1 & 1.1.1.2
+    ecs = datums.set_index('datum')['ec'].str.findall(ec_pattern).explode().dropna().map(padded_ec)
+    ecs = DataFrame({'datum': ecs.index, 'ec': ecs.to_numpy()}).drop_duplicates()
+
+    temporary_path = database_path+'.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    with sqlite3.connect(temporary_path) as connection:
+        datums.to_sql('datums', connection, index = False)
+        ecs.to_sql('datum_ecs', connection, index = False)
+        connection.execute('CREATE UNIQUE INDEX datums_datum ON datums (datum)')
+        for index in indexes:
+            connection.execute(f'CREATE INDEX datums_{index.split()[0]} ON datums ({index})')
+        connection.execute('CREATE INDEX datum_ecs_ec ON datum_ecs (ec, datum)')
+        connection.execute('ANALYZE')
+    connection.close()
+    os.replace(temporary_path, database_path)
+    print(f'{len(datums)} datums and {len(ecs)} EC codes are stored in {database_path}')
+    return database_path
+
+class tecr_store():
+    def __init__(self, database_path = os.path.join('TECRDB', 'merged_TECRDB.sqlite')):
+        # a read-only connection, which the query services can open per process
+        self.connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri = True, check_same_thread = False)
+
+    def query(self, ec = None, enzyme = None, reference_id = None, kegg = None, temperature = None, ph = None, columns = None):
+        # the datums that satisfy every condition, where the temperature and pH are values or (low, high) ranges
+        conditions, parameters = [], []
+        if ec is not None:
+            # the dashes of a partial EC code, like 2.7.3.-, match any number, as the range of its prefix that the index scans, where a code of only dashes matches every datum
+            ec = padded_ec(ec)
+            if ec.endswith('-'):
+                prefix = ec[:ec.index('-')]
+                if prefix:
+                    conditions.append('datum IN (SELECT datum FROM datum_ecs WHERE ec >= ? AND ec < ?)')
+                    parameters.extend([prefix, prefix[:-1]+chr(ord(prefix[-1])+1)])
+            else:
+                conditions.append('datum IN (SELECT datum FROM datum_ecs WHERE ec = ?)')
+                parameters.append(ec)
+        if enzyme is not None:
+            conditions.append('enzyme = ? COLLATE NOCASE')
+            parameters.append(enzyme.strip())
+        for field, value in [('reference_id', reference_id), ('kegg', kegg)]:
+            if value is not None:
+                conditions.append(f'{field} = ?')
+                parameters.append(value)
+        for field, value in [('temperature', temperature), ('ph', ph)]:
+            if isinstance(value, (tuple, list)):
+                conditions.append(f'{field} BETWEEN ? AND ?')
+                parameters.extend(value)
+            elif value is not None:
+                conditions.append(f'{field} = ?')
+                parameters.append(value)
+        selection = ', '.join(f'"{column}"' for column in columns) if columns else '*'
+        where = ' WHERE '+' AND '.join(conditions) if conditions else ''
+        return read_sql_query(f'SELECT {selection} FROM datums{where} ORDER BY datum', self.connection, params = parameters)
+
+    def close(self):
+        self.connection.close()
@@ -1,18 +1,14 @@
-from pandas import read_csv, DataFrame, read_excel
-from openpyxl import load_workbook
-from itertools import islice
-from numpy import nan, diff
+from pandas import read_csv, DataFrame, RangeIndex, read_excel, concat, to_numeric
+from numpy import nan, diff, array, isnan, floor, log10, sign, errstate, where
 from warnings import warn
-import sigfig
+from reactions import canonical_reaction
+from storage import read_table, write_table, load_dataset, load_sheet
+from database import build_database
 import json, re, os
 
-# homogenize the charge format    
-def charge_format(master_reaction):       
-    remove_string = None
-    if re.search('\w(\d\-)', master_reaction):
-        remove_string = re.search('\w(\d\-)', master_reaction).group(1)
-        master_reaction = re.sub(remove_string, '-{}'.format(remove_string), master_reaction)
-    return master_reaction, remove_string
+# normalize the names and references that identify a datum
+def _normalize(string):
+    return str(string).strip().lower()
 
 # add the units of logarithm to the Magnesium concentration
 def isnumber(string):
@@ -23,89 +19,189 @@ def isnumber(string):
             try:
                 int(string)
             except:
-                return False 
+                return False
         return True
 
+# parse the T, pH, and Keq columns into floats, flagging the approximate (~) and uncertain (?) values 
+def _numeric_columns(rows, significant_figures = None):
+    numbers = {}
+    for column in ['T [K]', 'pH', 'Keq']:
+        raw = rows[column].to_numpy()
+        text = rows[column].fillna('').astype(str).str.strip()
+        qualified = text.str.contains('~|\\?').to_numpy()
+        text = text.str.replace('(?<=\\w)\\?\\w+', '', regex = True).str.strip('~?').str.replace('l', '1')
+        values = to_numeric(text, errors = 'coerce').to_numpy(dtype = float)
+        if significant_figures:
+            values = _significant_figures(values, significant_figures)
+        # the text of the non-numeric values is compared verbatim
+        text = text.where(isnan(values) & ~text.isin(['nan', 'None']), '').to_numpy()
+        numbers[column] = (values, text, qualified, raw)
+    return numbers
+
+# round half up to the significant figures, as sigfig.round, with a margin for the binary representation of the decimals
+def _significant_figures(values, figures):
+    with errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+        # the digits are scaled by exact powers of ten, as the negative powers like 1e-16 add float noise to the large magnitudes
+        exponents = figures - 1 - floor(log10(abs(values)))
+        powers = 10.0**abs(exponents)
+        digits = floor(where(exponents >= 0, abs(values)*powers, abs(values)/powers) + 0.5 + 1e-9)
+        rounded = sign(values)*where(exponents >= 0, digits/powers, digits*powers)
+    rounded[values == 0] = 0
+    return rounded
+
+# the mask of the master block whose values agree with the new datum
+def _agreement(master_numbers, new_numbers, block, new_index):
+    agreement = {}
+    for column, (values, text, qualified, raw) in master_numbers.items():
+        new_values, new_text = new_numbers[column][0][new_index], new_numbers[column][1][new_index]
+        agreement[column] = (values[block] == new_values) | (isnan(values[block]) & isnan(new_values) & (text[block] == new_text))
+    return agreement
+
+# describe how a dataset maps onto the master columns and how its datums are merged
+class source_adapter():
+    def __init__(self, name, columns, enzyme_column, reference_column, magnesium_column, significant_figures = None, excel_sheet = None):
+        self.name = name
+        self.columns = columns                    # {master column: source column, or a function of the source dataframe}
+        self.enzyme_column = enzyme_column
+        self.reference_column = reference_column
+        self.magnesium_column = magnesium_column
+        self.significant_figures = significant_figures    # the precision of the T, pH, and Keq comparisons, else exact
+        self.excel_sheet = excel_sheet
+
+    # transform the source columns into master rows
+    def rows(self, new_file, master_columns):
+        rows = DataFrame(None, index = new_file.index, columns = master_columns, dtype = 'object')
+        rows[self.name+'_index'] = new_file.index
+        for master_column, column in self.columns.items():
+            rows[master_column] = column(new_file) if callable(column) else new_file[column]
+        return rows.astype('object').where(rows.notna(), None)
+
+def _magnesium_potential(new_file):
+    return new_file['p_mg'].map(lambda p_mg: f'{p_mg} = -log[Mg+2]' if isnumber(p_mg) else p_mg)
+
+def _du_conditions(new_file):
+    conditions = [' ; '.join([str(x) for x in values if x is not None])
+                  for values in zip(new_file['media conditions'], new_file['electrolytes'], new_file['pMg'])]
+    return DataFrame({'conditions': conditions}, index = new_file.index)['conditions'].str.replace(r';\s+;', '', regex = True)
+
+sources = {
+    'noor': source_adapter('noor', {
+            'Enzyme:': 'enzyme_name',
+            'KEGG Reaction:': 'reaction',
+            'EC Value:': 'EC',
+            'Reaction:': 'description',
+            'Reference ID:': 'reference',
+            'T [K]': 'temperature',
+            'pH': 'p_h',
+            'Keq': lambda new_file: new_file['K_prime'].where(new_file['K_prime'].notna(), new_file['K']),
+            'Experimental conditions': _magnesium_potential,
+            'Ionic strength [mol/dm^3]': 'ionic_strength',
+            'Method:': 'method'
+        }, 'enzyme_name', 'reference', 'p_mg'),
+    'du': source_adapter('du', {
+            'Enzyme:': 'Enzyme',
+            'CID Reaction:': 'Reaction formula in CID format',
+            'EC Value:': 'EC value',
+            'Reaction:': 'Reaction',
+            'Reference ID:': 'Reference_id',
+            'T [K]': 'T(K)',
+            'pH': 'pH',
+            'Keq': 'K\'',
+            'Experimental conditions': _du_conditions,
+            'Ionic strength [mol/dm^3]': 'Ionic strength',
+            'Buffer:': 'Buffer/reagents/solute added',
+            'Method:': 'Method'
+        }, 'Enzyme', 'Reference_id', 'pMg', 2, 'Table S1. TECRDB Keqs'),
+    }
+
 class merge_TECRs():
     def __init__(self, master_path, verbose = False):
         self.master_path = master_path
         self.verbose = verbose
         if not os.path.exists('TECRDB'):
             os.mkdir('TECRDB')
-        with open(master_path, encoding='utf-8') as master:
-            self.master_file = read_csv(master, dtype = 'object')
-            self.master_file.fillna(' ')
-            self.master_file.index.name = 'NIST_index'
+        if master_path.endswith('.csv'):
+            self.master_file = load_dataset(master_path, dtype = 'object')
             del self.master_file['Unnamed: 0']
+        else:
+            # the typed table is loaded as the text of the CSV
+            self.master_file = read_table(master_path, typed = False)
+        self.master_file.fillna(' ')
+        self.master_file.index.name = 'NIST_index'
             
-            # insert the relevant columns
-            empty_col = [' ' for row in range(len(self.master_file))]  
-            self.master_file.insert(0, 'noor_index', empty_col)  
-            self.master_file.insert(0, 'du_index', empty_col)
-            self.master_file.insert(0, 'NIST_index', self.master_file.index)
-            self.master_file.insert(4, 'KEGG Reaction:', empty_col)
-            self.master_file.insert(5, 'CID Reaction:', empty_col)
+        # insert the relevant columns
+        empty_col = [' ' for row in range(len(self.master_file))]  
+        self.master_file.insert(0, 'noor_index', empty_col)  
+        self.master_file.insert(0, 'du_index', empty_col)
+        self.master_file.insert(0, 'NIST_index', self.master_file.index)
+        self.master_file.insert(4, 'KEGG Reaction:', empty_col)
+        self.master_file.insert(5, 'CID Reaction:', empty_col)
+        self.staged_rows = []
         
-    def merge(self, new_path, new_enzyme_col, new_reference_col, manual_curation_csv_path, excel_sheet):
-        self.scraping = new_path.split('_')[-1].split('.')[0]
+    def merge(self, new_path, new_enzyme_col = None, new_reference_col = None, manual_curation_csv_path = None, excel_sheet = None, source = None):
+        # the source adapter defaults to the dataset suffix of the filename 
+        self.scraping = source or new_path.split('_')[-1].split('.')[0]
+        self.source = sources[self.scraping]
+        excel_sheet = excel_sheet or self.source.excel_sheet
         print(self.scraping)
         if '.csv' in new_path:
-            with open(new_path, encoding='utf-8') as new:
-                self.new_file = read_csv(new, dtype = 'object')
-                self.new_file.fillna(' ')
+            self.new_file = load_dataset(new_path, dtype = 'object')
+            self.new_file.fillna(' ')
         elif '.xlsx' in new_path:
-            ws = load_workbook(new_path)[excel_sheet]
-            data = (islice(r, 1, None) for r in list(ws.values))
-            self.new_file = DataFrame(data, index=[r[0] for r in ws.values], columns=next(ws.values)[1:])
-            self.new_file.drop(self.new_file.index[0], inplace=True)
-            self.new_file.insert(0, 'Enzyme', self.new_file.index)
-            self.new_file.index = [x for x in range(len(self.new_file.index))]
+            # the first column of the sheet names the enzyme of each row
+            sheet = load_sheet(new_path, excel_sheet)
+            self.new_file = sheet.iloc[:, 1:]
+            self.new_file.insert(0, 'Enzyme', sheet.iloc[:, 0])
             self.new_file.fillna(' ')
             # print(self.new_file.head())
-        self._add_rows(new_enzyme_col, new_reference_col)
+        self.new_rows = self.source.rows(self.new_file, self.master_file.columns)
+        self._add_rows(new_enzyme_col or self.source.enzyme_column, new_reference_col or self.source.reference_column)
         self._merge_existing()
         self._incorporate_manual_curation(manual_curation_csv_path)
         self._confirm_merging()
         
         # export the processes database file
-        self.master_file.to_csv(os.path.join('TECRDB', 'merged_TECRDB.csv'))
+        write_table(self.master_file, os.path.join('TECRDB', 'merged_TECRDB.parquet'))
+        build_database(self.master_file, os.path.join('TECRDB', 'merged_TECRDB.sqlite'))
         # sleep(2)
         # with ZipFile('TECRDB.zip', 'w', compression = ZIP_LZMA) as zip:
         #     for file in ['TECR_consolidated.json', 'amalgamated_TECR_scrape.csv', 'TECRDB_scrape.csv']:
         #         zip.write(file)
         #         os.remove(file)
         return self.master_file
+    
+    # merge several datasets in order, given as {source name: (dataset path, manual curation path)}
+    def merge_sources(self, source_paths):
+        for source, (new_path, manual_curation_csv_path) in source_paths.items():
+            self.merge(new_path, manual_curation_csv_path = manual_curation_csv_path, source = source)
+        return self.master_file
             
     def _merge_existing(self):
-        def equal(val1, val2):
-            if isinstance(val1, str) and isinstance(val2, str):
-                if isnumber(val1) and isnumber(val2):
-                    if self.__rounding(val1) != self.__rounding(val2):
-                        error = r''.join([str(x) for x in [master_index, '___', val1, '___', val2]])
-                        if self.verbose:
-                           warn(error) 
-                        errors.append(error)
-                elif val1 != ' ' and val2 != ' ':
-                    return val1 == val2
-            else:
-                return self.__rounding(val1) == self.__rounding(val2)
+        # parse the numeric values once, and block the master datums by their enzyme and reference
+        master_numbers = _numeric_columns(self.master_file, self.source.significant_figures)
+        new_numbers = _numeric_columns(self.new_rows, self.source.significant_figures)
+        self.qualifiers = {column: qualified for column, (values, text, qualified, raw) in new_numbers.items()}
+        master_references = [re.sub('_.+', '', str(reference)) for reference in self.master_file['Reference ID:']]
+        master_blocks, master_enzymes = {}, {}
+        for master_index, enzyme, reference in zip(self.master_file.index, self.master_file['Enzyme:'], master_references):
+            master_blocks.setdefault((_normalize(enzyme), _normalize(reference)), []).append(master_index)
+            master_enzymes.setdefault(_normalize(enzyme), []).append(master_index)
+        master_blocks = {key: array(block) for key, block in master_blocks.items()}
+        master_enzymes = {key: array(block) for key, block in master_enzymes.items()}
+        master_reactions = dict(zip(self.master_file.index, map(canonical_reaction, self.master_file['Reaction:'])))
                 
         matched_master_indices, errors_dictionary = {}, {}
         unmatched_entries = 0
-        for new_index, new_row in self.new_file.iterrows():
+        for new_index, new_enzyme, new_reaction, new_reference in zip(
+                self.new_rows.index, self.new_rows['Enzyme:'], map(canonical_reaction, self.new_rows['Reaction:']), self.new_rows['Reference ID:']):
             if new_index not in self.new_additions:
                 matched_datum = False
-                
-                # define the new values for this datum 
-                (NIST_index, du_index, noor_index, new_enzyme, add_kegg_reaction, add_cid_reaction, add_ec, new_reaction, reference_string, 
-                 new_reference, new_temperature, new_ph, new_k, km, environmental_conditions, ionic_strength_1, enthalpy, solutes_1, buffer, add_pmg, 
-                 add_method, add_ionic_strength, solutes_2 
-                 ) = self.__define_row(new_index, new_row)
 
-                # determine the set of possible matches
+                # the candidates share the enzyme and reference, and their T, pH, and Keq agree within the tolerance of the source
                 errors = []
-                matching_master_subset = self.master_file.loc[self.master_file['Enzyme:'] == new_enzyme]    #  & (master_file['Keq'] == new_k) & (master_file['T [K]'] == new_temperature) & (master_file['pH '] == new_ph)   #!!! other criteria besides the name should be considered for matching.
-                for master_index, master_row in matching_master_subset.iterrows():  
+                block = master_blocks.get((_normalize(new_enzyme), _normalize(new_reference)), array([], dtype = int))
+                agreement = _agreement(master_numbers, new_numbers, block, new_index)
+                for master_index in block[agreement['T [K]'] & agreement['pH'] & agreement['Keq']]:  
                     # remove previously matched rows
                     if master_index in matched_master_indices:
                         error = f'IndexAlreadyMatched: The NIST index {master_index} is already matched to the new_index {matched_master_indices[master_index]}.'
@@ -113,79 +209,30 @@ class merge_TECRs():
                             warn(error)
                         errors.append(error)
                         continue
-
-                    # match references
-                    if not equal(new_reference, re.sub('_.+', '', master_row['Reference ID:'])):
-                        error = f'ReferenceAlreadyAssigned: The NIST index {master_index} is already matched with the {re.sub("_.+", "", master_row["Reference ID:"])} reference, and thus cannot be assigned with the {new_reference}.'
+                        
+                    # match the canonical reactions
+                    if new_reaction != master_reactions[master_index]:
+                        error = f'CodeError: The master reaction {master_reactions[master_index]} | {master_index} does not match the new reaction {new_reaction} | {new_index}.'
                         if self.verbose:
-                            warn(error)
+                           warn(error)
                         errors.append(error)
                         continue
 
-                    # compare values
-                    if re.search('\w(\?\w+)', str(master_row['Keq'])):
-                        master_row['Keq'] = re.sub('(\?\w+)', '', str(master_row['Keq']))
-                    for new, master in zip(
-                            [str(new_k).strip('~?'), str(new_temperature).replace('l', '1'), str(new_ph).strip('?~')], 
-                            [str(master_row['Keq']).strip('~?'), str(master_row['T [K]']).replace('l', '1'), str(master_row['pH']).strip('?~')]):
-                        if not equal(new, master):
-                            error = f'DatumNotMatchErorr: The new value {new} | {new_index} does not match the existing value {master} | {master_index}.'
-                            if self.verbose:
-                               warn(error)
-                            errors.append(error)
-                            continue
-                        
-                    # match the reactions after multiple iterations 
-                    master_reaction = master_row['Reaction:'] 
-                    if self.scraping == 'noor':    
-                        master_reaction = re.sub('\u00ce\u00b1|\u00ce\u00b2', '', master_reaction)
-                        master_reaction = re.sub('\u00cf\u2030', '-w', master_reaction)
-                    tries = 0
-                    match = True
-                    while new_reaction != master_reaction:
-                        if tries == 0:
-                            if re.search('= -\w', master_reaction):
-                                remove_string = re.search('=(\s-)\w', master_reaction).group(1)
-                                master_reaction = re.sub(remove_string, '-', master_reaction)
-                        elif tries == 1:
-                            if new_reaction != master_reaction:
-                                if re.search(' -D-', master_reaction):
-                                    remove_string = re.search('\s(-D-)', master_reaction).group(1)
-                                    master_reaction = re.sub(remove_string, 'D-', master_reaction, 1)
-                        elif tries == 2:
-                            if re.search('\w\d\-', master_reaction):
-                                loop = True
-                                while loop:
-                                    master_reaction, remove_string = charge_format(master_reaction)
-                                    if remove_string is None:
-                                        loop = False
-                        elif tries == 3:
-                            if re.search('\(\w\)\-', master_reaction):
-                                master_reaction = re.sub('\(\w\)\-', '', master_reaction)
-                        elif tries == 4:
-                            if re.search('-lipoate', master_reaction):
-                                master_reaction = re.sub('(-lipoate)', 'lipoate', master_reaction, 1)
-                        else:
-                            error = f'CodeError: The master reaction {master_reaction} | {master_index} does not match the new reaction {new_reaction} | {new_index}.'
-                            if self.verbose:
-                               warn(error)
-                            errors.append(error)
-                            match = False
-                            break
-                        tries += 1
-
                     # define the new data of the master file
-                    if match:
-                        matched_datum = True
-                        matched_master_indices[master_index] = new_index
-                        self.__redefine_master(master_row, new_row, master_index, new_index)
-                        break
+                    matched_datum = True
+                    matched_master_indices[master_index] = new_index
+                    self.__redefine_master(self.master_file.loc[master_index], master_index, new_index)
+                    break
 
                 if not matched_datum:
                     if self.verbose:
                         warn(f'CodeError: Failed index to match {new_enzyme} | {new_index}')
                     unmatched_entries += 1
+                    errors.extend(self.__unmatched_errors(
+                        master_enzymes.get(_normalize(new_enzyme), array([], dtype = int)), master_numbers, master_references, new_numbers, 
+                        matched_master_indices, new_index, new_reference))
                     errors_dictionary[new_index] = errors
+        self.__commit_rows()
 
         # test for standard_id uniqueness and unmatched values
         duplicate_entries = '\t'.join(
@@ -196,6 +243,25 @@ class merge_TECRs():
         # export the unmatched datums
         with open(f'TECRDB/unmatched_{self.scraping}_TECRDB_datums.json', 'w') as output:
             json.dump(errors_dictionary, output, indent = 3)
+        
+    # explain why the datums of the same enzyme were not matched
+    def __unmatched_errors(self, block, master_numbers, master_references, new_numbers, matched_master_indices, new_index, new_reference):
+        errors = []
+        agreement = _agreement(master_numbers, new_numbers, block, new_index)
+        for position, master_index in enumerate(block):
+            if master_index in matched_master_indices:
+                errors.append(f'IndexAlreadyMatched: The NIST index {master_index} is already matched to the new_index {matched_master_indices[master_index]}.')
+                continue
+            if _normalize(new_reference) != _normalize(master_references[master_index]):
+                errors.append(f'ReferenceAlreadyAssigned: The NIST index {master_index} is already matched with the {master_references[master_index]} reference, and thus cannot be assigned with the {new_reference}.')
+                continue
+            for column in ['T [K]', 'pH', 'Keq']:
+                if not agreement[column][position]:
+                    errors.append(f'DatumNotMatchErorr: The new value {new_numbers[column][3][new_index]} | {new_index} does not match the existing value {master_numbers[column][3][master_index]} | {master_index}.')
+        if self.verbose:
+            for error in errors:
+                warn(error)
+        return errors
 
     def _incorporate_manual_curation(self, manual_curation_path):
         # import and clean the manual curation file
@@ -205,13 +271,13 @@ class merge_TECRs():
         headings = []
         for column in manual_curation_csv:
             headings.append(column.strip())
-            for index, val in manual_curation_csv[column].iteritems():
-                manual_curation_csv[column].iloc[index] = str(val).strip()
+            manual_curation_csv[column] = manual_curation_csv[column].astype(str).str.strip()
         manual_curation_csv.columns = headings
 
         # parse the manually curated content
         parsing_errors = []
         self.duplicates = set()
+        merged_ids = set(self.master_file[self.scraping+'_index'])
         for index, row in manual_curation_csv.iterrows():
             # characterize the curated datums            
             error = row['Error resolution']
@@ -239,12 +305,12 @@ class merge_TECRs():
             parsing_errors = None
             if add or merge:
                 for new_id_index, new_id in enumerate(new_ids):
-                    new_row = self.new_file.iloc[new_id]
-                    if new_id not in self.master_file[self.scraping+'_index'].to_list():
+                    if new_id not in merged_ids:
                         if add:
-                            self.master_file.loc[len(self.master_file)] = self.__define_row(new_id, new_row)
+                            self.__stage_row(new_id)
                         elif merge:
-                            self.__redefine_master(self.master_file.iloc[new_id_index], new_row, master_file_ids[new_id_index], new_id)
+                            self.__redefine_master(self.master_file.iloc[new_id_index], master_file_ids[new_id_index], new_id)
+                        merged_ids.add(new_id)
                     else:
                         if self.verbose:
                             warn(f'CurationError: Repeated {self.scraping} index {new_id}.')
@@ -259,6 +325,7 @@ class merge_TECRs():
                     parsing_errors.append(master_file_ids)
                     print(f'CodeError: The {new_ids} new_id was not captured during parsing.')
 
+        self.__commit_rows()
         print('Parsing errors: ', parsing_errors)
     
     def _confirm_merging(self):
@@ -286,87 +353,31 @@ class merge_TECRs():
         
         # add new data rows
         self.new_additions = set()
-        for new_index, new_row in self.new_file.iterrows():
-            if new_row[new_reference_col] in missing_master_references or new_row[new_enzyme_col] in missing_master_enzymes:
-                self.master_file.loc[len(self.master_file)] = self.__define_row(new_index, new_row)
-                self.new_additions.add(new_index)
-       
-        # format the magnesium potential
-        undescribed = list(self.master_file['Experimental conditions'])[original_master_length+1:]
-        for index, row in enumerate(undescribed):
-            if isnumber(row):
-                self.master_file.at[index+original_master_length+1, 'Experimental conditions'] = f'{row} = -log[Mg+2]'
+        missing = self.new_file[new_reference_col].isin(missing_master_references) | self.new_file[new_enzyme_col].isin(missing_master_enzymes)
+        for new_index in self.new_file.index[missing]:
+            self.__stage_row(new_index)
+            self.new_additions.add(new_index)
+        self.__commit_rows()
 
         if original_master_length == len(self.master_file):
             warn('CodeError: The master file has not changed length.')
         print('total additions', len(list(self.new_additions)))
 
-    def __rounding(self, number):
-        if self.scraping == 'noor':
-            return float(number)
-        elif self.scraping == 'du':
-            return sigfig.round(number, 2)
+    # stage the new datums, and append them to the master file with one concatenation per merging phase
+    def __stage_row(self, new_index):
+        self.staged_rows.append(new_index)
         
-    def __define_row(self, new_index, new_row):
-        du_index = noor_index = kegg_reaction = cid_reaction = environmental_conditions = buffer = p_mg = None
-        if self.scraping == 'noor':
-            noor_index = new_index
-            enzyme = new_row['enzyme_name']
-            kegg_reaction = new_row['reaction']
-            ec = new_row['EC']
-            reaction = new_row['description']
-            ref_id = new_row['reference']
-            temperature = new_row['temperature']
-            pH = new_row['p_h']
-            keq = new_row['K_prime']
-            if keq is nan:
-                keq = new_row['K']
-            ionic_strength = new_row['ionic_strength']
-            p_mg = new_row['p_mg']
-            method = new_row['method']
-        elif self.scraping == 'du':
-            environmental_conditions = ' ; '.join([str(x) for x in [new_row['media conditions'], new_row['electrolytes'], new_row['pMg']] if x is not None])
-            environmental_conditions = re.sub(';\s+;', '', environmental_conditions)
-            du_index = new_index
-            enzyme = new_row['Enzyme']
-            cid_reaction = new_row['Reaction formula in CID format']
-            ec = new_row['EC value']
-            reaction = new_row['Reaction']
-            ref_id = new_row['Reference_id']
-            temperature = new_row['T(K)']
-            pH = new_row['pH']
-            keq = new_row['K\'']
-            ionic_strength = new_row['Ionic strength']
-            buffer = new_row['Buffer/reagents/solute added']
-            method = new_row['Method']
-        return [
-            None,                      # NIST_index 
-            du_index,                  # f'https://w3id.org/related-to/doi.org/10.5281/zenodo.5494490/files/TableS1_Keq.csv#Keq_{new_index}',  
-            noor_index,                # f'https://w3id.org/related-to/doi.org/10.5281/zenodo.3978439/files/TECRDB.csv#entry{new_index}', 
-            enzyme,                    # add_enzyme
-            kegg_reaction,             # add_kegg_reaction
-            cid_reaction,              # add_cid_reaction
-            ec,                        # add_ec 
-            reaction,                  # add_reaction
-            None,                      # reference_string
-            ref_id,                    # add_reference
-            temperature,               # add_temperature
-            pH,                        # add_ph
-            keq,                       # Keq  
-            None,                      # km
-            environmental_conditions,  # environmental_conditions
-            ionic_strength,            # add_ionic_strength
-            None,                      # enthalpy
-            None,                      # solutes_1
-            buffer,                    # buffer
-            p_mg,                      # add_pmg
-            method,                    # add_method
-            None,                      # ionic_strength_1
-            None,                      # solutes_2
-            ]
+    def __commit_rows(self):
+        if self.staged_rows:
+            rows = self.new_rows.loc[self.staged_rows]
+            rows.index = RangeIndex(len(self.master_file), len(self.master_file)+len(rows), name = self.master_file.index.name)
+            self.master_file = concat([self.master_file, rows])
+            self.staged_rows = []
     
     # merging values between matched datum
-    def __redefine_master(self, master_row, new_row, master_index, new_index, verbose = False):
+    def __redefine_master(self, master_row, master_index, new_index, verbose = False):
+        new_row = self.new_rows.loc[new_index]
+        
         # print the datum pair for manual inspection
         if verbose:
             print('\nmatched pair:', '\n', '='*len('matched pair:'))
@@ -375,14 +386,11 @@ class merge_TECRs():
 
         # match KEGG reactions
         master_kegg = master_row['KEGG Reaction:']
-        if master_kegg == ' ' and self.scraping == 'noor':
-            self.master_file.at[master_index, 'KEGG Reaction:'] = new_row['reaction']
+        if master_kegg == ' ' and new_row['KEGG Reaction:'] not in [None, ' ', nan]:
+            self.master_file.at[master_index, 'KEGG Reaction:'] = new_row['KEGG Reaction:']
 
         # match magnesium concentrations
-        if self.scraping == 'noor':
-            new_pmg = new_row['p_mg']
-        elif self.scraping == 'du':
-            new_pmg = new_row['pMg']
+        new_pmg = self.new_file.at[new_index, self.source.magnesium_column]
         if master_row['Experimental conditions'] != f'{new_pmg} = -log[Mg+2]' and new_pmg != ' ':
             if master_row['Experimental conditions'] in [None, ' ', nan]:
                 self.master_file.at[master_index, 'Experimental conditions'] = f'{new_pmg} = -log[Mg+2]'
@@ -401,10 +409,7 @@ class merge_TECRs():
 #             print(master_index, '\t', 'new pmg', '\t', master_file.at[master_index, 'Experimental conditions'])  
                 
         # match methods
-        if self.scraping == 'noor':
-            new_method = new_row['method']
-        elif self.scraping == 'du':
-            new_method = new_row['Method']
+        new_method = new_row['Method:']
         if master_row['Method:'] in [None, ' ', nan]:
             self.master_file.at[master_index, 'Method:'] = new_method
         elif new_method not in [None, ' ', nan]:
@@ -417,10 +422,7 @@ class merge_TECRs():
 
         # match EC values
         master_ec = master_row['EC Value:']
-        if self.scraping == 'noor':
-            new_ec = new_row['EC']
-        elif self.scraping == 'du':
-            new_ec = new_row['EC value']
+        new_ec = new_row['EC Value:']
         if master_ec not in [None, ' ', nan]:
             if master_ec == new_ec:
                 self.master_file.at[master_index, 'EC Value:'] = master_ec   
@@ -438,10 +440,7 @@ class merge_TECRs():
 
         # match ionic strength concentrations
         master_ionic_strength = master_row['Ionic strength [mol/dm^3]']
-        if self.scraping == 'noor':
-            new_ionic_strength = new_row['ionic_strength']
-        elif self.scraping == 'du':
-            new_ionic_strength = new_row['Ionic strength']
+        new_ionic_strength = new_row['Ionic strength [mol/dm^3]']
         if master_ionic_strength in [None, ' ', nan]:
             self.master_file.at[master_index, 'Ionic strength [mol/dm^3]'] = new_ionic_strength
         elif new_ionic_strength not in [None, ' ', nan]:
@@ -453,7 +452,7 @@ class merge_TECRs():
         if master_row[self.scraping+'_index'] != ' ':
             if self.verbose:
                 warn('The master_index {master_index} is predefined as {master_row[self.scraping+"_index"]}.')
-            self.master_file.loc[len(self.master_file)] = self.__define_row(new_index, new_row)
+            self.__stage_row(new_index)
         else:
             self.master_file.at[master_index, self.scraping+'_index'] = new_index
     
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent cache of the PubMed references, which resolves its misses through the E-utilities
+"""
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+from more_itertools import chunked
+from warnings import warn
+import asyncio, sqlite3, time
+import httpx
+
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+TTL = 30*24*3600    # seconds
+reference_fields = ['pmid', 'doi', 'year', 'authors', 'abstract']
+
+class reference_cache():
+    def __init__(self, path = 'references_cache.sqlite', ttl = TTL):
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS refs (pmid TEXT PRIMARY KEY, doi TEXT, year INTEGER, authors TEXT, abstract TEXT, fetched REAL)')
+
+    def get(self, pmids):
+        # the cached references that are younger than the TTL
+        pmids = list(pmids)
+        references = {}
+        for chunk in chunked(pmids, 500):
+            rows = self.connection.execute(
+                f'SELECT pmid, doi, year, authors, abstract FROM refs WHERE fetched > ? AND pmid IN ({",".join("?"*len(chunk))})',
+                [time.time() - self.ttl] + chunk)
+            references.update({row[0]: row for row in rows})
+        return references
+
+    def put(self, references):
+        fetched = time.time()
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?, ?)', [tuple(reference) + (fetched,) for reference in references])
+
+    def close(self):
+        self.connection.close()
+
+# parse the PubmedArticle elements of an efetch response into the reference fields
+def _text(element, path):
+    found = element.find(path)
+    return found.text if found is not None else None
+
+def parse_articles(xml):
+    references = []
+    for article in ElementTree.fromstring(xml).iter('PubmedArticle'):
+        year = _text(article, ".//PubMedPubDate[@PubStatus='pubmed']/Year") or _text(article, './/JournalIssue/PubDate/Year')
+        authors = []
+        for author in article.iter('Author'):
+            lastname, firstname = _text(author, 'LastName'), _text(author, 'ForeName')
+            if lastname:
+                authors.append(lastname + (' ' + firstname if firstname else ''))
+        abstract = '\n'.join(''.join(text.itertext()) for text in article.iter('AbstractText')) or None
+        references.append((
+            _text(article, 'MedlineCitation/PMID'), _text(article, ".//PubmedData/ArticleIdList/ArticleId[@IdType='doi']"),
+            int(year) if year else None, ', '.join(authors), abstract
+            ))
+    return references
+
+async def _efetch(client, semaphore, pmids, eutils_url, parameters, retries):
+    # fetch a chunk of references, where throttled and failed requests are retried with an exponential backoff
+    for attempt in range(retries+1):
+        async with semaphore:
+            try:
+                response = await client.get(eutils_url+'efetch.fcgi', params = {'db': 'pubmed', 'retmode': 'xml', 'id': ','.join(pmids), **parameters})
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    return parse_articles(response.content)
+                error = f'HTTP {response.status_code}'
+            except httpx.TransportError as exception:
+                error = repr(exception)
+        if attempt < retries:
+            await asyncio.sleep(0.5 * 2**attempt)
+    warn(f'ConnectionError: The PMIDs {", ".join(pmids)} were not fetched after {retries+1} attempts ({error}).')
+    return []
+
+async def _fetch_references(pmids, chunk_size, concurrency, eutils_url, parameters, retries, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout = timeout) as client:
+        chunks = await asyncio.gather(*[_efetch(client, semaphore, chunk, eutils_url, parameters, retries) for chunk in chunked(pmids, chunk_size)])
+    return [reference for chunk in chunks for reference in chunk]
+
+def fetch_references(pmids, chunk_size = 100, concurrency = 3, eutils_url = EUTILS_URL, tool = 'MyTool', email = 'elad.noor@weizmann.ac.il', api_key = None, retries = 3, timeout = 30):
+    # the E-utilities permit 3 requests per second, or 10 with an API key
+    parameters = {'tool': tool, 'email': email}
+    if api_key is not None:
+        parameters['api_key'] = api_key
+    coroutine = _fetch_references(list(pmids), chunk_size, concurrency, eutils_url, parameters, retries, timeout)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # the event loop of a notebook is already running
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, coroutine).result()
+
+def resolve_references(pmids, cache_path = 'references_cache.sqlite', ttl = TTL, known = None, offline = False, **fetch_arguments):
+    # the references of the PMIDs, from the known references, then the cache, where only the missing and expired references are fetched
+    pmids = list(dict.fromkeys(pmids))
+    references = {pmid: known[pmid] for pmid in pmids if known and pmid in known}
+    cache = reference_cache(cache_path, ttl)
+    references.update(cache.get([pmid for pmid in pmids if pmid not in references]))
+    missing = [pmid for pmid in pmids if pmid not in references]
+    if offline:
+        print(f'{len(references)} references are resolved locally, and {len(missing)} are unresolved offline.')
+    else:
+        print(f'{len(references)} references are resolved locally, and {len(missing)} are fetched from PubMed.')
+        if missing:
+            fetched = fetch_references(missing, **fetch_arguments)
+            cache.put(fetched)
+            references.update({reference[0]: reference for reference in fetched})
+    cache.close()
+    return [references[pmid] for pmid in pmids if pmid in references]
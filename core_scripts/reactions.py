@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Canonical forms of the reaction strings, shared by the merging, comparison, and JSON scripts
+"""
+from functools import lru_cache
+import re
+
+# the rewrite rules that homogenize the NIST reaction strings with the Noor and Du formats
+_greek_letters = re.compile('\u00ce\u00b1|\u00ce\u00b2')    # the mojibake of α and β
+_omega = re.compile('\u00cf\u2030')                          # the mojibake of ω
+_negative_product = re.compile(r'= -\w')
+_d_isomer = re.compile(r'\s(-D-)')
+_charge = re.compile(r'\w(\d\-)')
+_locant = re.compile(r'\(\w\)\-')
+_stoichiometry = re.compile(r'\d\s')
+
+# homogenize the charge format
+def charge_format(reaction):
+    remove_string = None
+    match = _charge.search(reaction)
+    if match:
+        remove_string = match.group(1)
+        reaction = reaction.replace(remove_string, '-{}'.format(remove_string))
+    return reaction, remove_string
+
+@lru_cache(maxsize = None)
+def canonical_reaction(reaction):
+    if not isinstance(reaction, str):
+        return reaction
+    reaction = _greek_letters.sub('', reaction)
+    reaction = _omega.sub('-w', reaction)
+    if _negative_product.search(reaction):
+        reaction = reaction.replace(' -', '-')
+    if _d_isomer.search(reaction):
+        reaction = reaction.replace('-D-', 'D-', 1)
+    remove_string = True
+    while remove_string is not None:
+        reaction, remove_string = charge_format(reaction)
+    reaction = _locant.sub('', reaction)
+    return reaction.replace('-lipoate', 'lipoate', 1)
+
+# split the reaction into the reactant and product stoichiometries
+@lru_cache(maxsize = None)
+def _split_reaction(reaction):
+    sides = []
+    for side in reaction.split('='):
+        species = []
+        for chemical in side.split(' + '):
+            stoich = 1
+            match = _stoichiometry.search(chemical)
+            if match:
+                stoich = match.group()
+            species.append((chemical, stoich))
+        sides.append(species)
+    return sides
+
+def reaction_stoichiometry(reaction):
+    reactants, products = _split_reaction(reaction)
+    return dict(reactants), dict(products)
@@ -1,28 +1,97 @@
 # import modules
 from pandas import read_csv, isnull, DataFrame
+from functools import cached_property
 from zipfile import ZipFile, ZIP_LZMA
-from more_itertools import chunked
-from pymed import PubMed
+from pubmed import resolve_references, reference_fields, TTL
 from io import StringIO
+from storage import write_table, load_dataset, load_members
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import pyarrow as pa
 import httpx
 import re, os
 
 CHUNK_SIZE = 100
+# the archived TECR data and reference snapshot, with their read options
+archive_members = {'amalgamated_TECR_scrape.csv': {}, 'references_with_abstracts.csv': {'dtype': {'pmid': str}}}
+doi_sources = ['doi_from_Robert', 'doi_from_pubmed']
+
+def reference_keys(mappings, reference_ids_column, pmid_column, doi_column):
+    # the PMID and DOI of each reference code, where the DOI of doi_column precedes those of the other sources
+    doi_columns = [doi_column] + [column for column in doi_sources if column != doi_column and column in mappings]
+    keys = mappings[[reference_ids_column, pmid_column] + doi_columns].dropna(subset = [reference_ids_column])
+    keys = keys.drop_duplicates(reference_ids_column, keep = 'last').astype('object')
+    dois = keys[doi_columns].apply(lambda column: column.where(column.notna() & (column.astype(str).str.strip() != '')))
+    distinct_dois = dois.apply(lambda column: column.str.strip().str.lower()).nunique(axis = 1)
+    print(f'{(distinct_dois > 1).sum()} conflicting DOIs are resolved by the precedence of {" over ".join(doi_columns)}')
+    return pa.table({
+        'code': pa.array(keys[reference_ids_column].astype(str), pa.string(), from_pandas = True),
+        'PMID': pa.array(keys[pmid_column], pa.string(), from_pandas = True),
+        'DOI': pa.array(dois.bfill(axis = 1).iloc[:, 0], pa.string(), from_pandas = True),
+        })
+
+def join_references(table, keys):
+    # a hash join of the reference keys onto the Reference ID of the TECRDB table, which inserts the PMID and DOI columns
+    indices = pc.index_in(table.column('Reference ID:'), value_set = keys.column('code'))
+    table = table.add_column(4, 'PMID', pc.fill_null(pc.take(keys.column('PMID'), indices), ' '))
+    table = table.add_column(5, 'DOI', pc.fill_null(pc.take(keys.column('DOI'), indices), ' '))
+    coverage = {
+        'datums': table.num_rows, 'datums with a PMID': pc.sum(pc.not_equal(table.column('PMID'), ' ')).as_py() or 0,
+        'datums with a DOI': pc.sum(pc.not_equal(table.column('DOI'), ' ')).as_py() or 0,
+        'matched codes': set(pc.unique(pc.drop_null(indices)).to_pylist())
+        }
+    return table, coverage
+
+def _report_coverage(coverage, keys):
+    coverage['matched codes'] = len(coverage['matched codes'])
+    coverage['unmatched codes'] = keys.num_rows - coverage['matched codes']
+    print(f"References added to {coverage['datums with a PMID']}/{coverage['datums']} datums, with a DOI for {coverage['datums with a DOI']}, "
+          f"from {coverage['matched codes']} reference codes, where {coverage['unmatched codes']} codes are absent from the TECRDB")
+    return coverage
+
+def map_references_file(source_path, destination_path, keys, batch_size = 65536):
+    # join the reference keys onto a Parquet TECRDB table in batches, so that only the keys are held in memory
+    coverage = {'datums': 0, 'datums with a PMID': 0, 'datums with a DOI': 0, 'matched codes': set()}
+    writer = None
+    for batch in pq.ParquetFile(source_path).iter_batches(batch_size = batch_size):
+        table, batch_coverage = join_references(pa.Table.from_batches([batch]), keys)
+        for key, value in batch_coverage.items():
+            coverage[key] = coverage[key] | value if key == 'matched codes' else coverage[key] + value
+        if writer is None:
+            writer = pq.ParquetWriter(destination_path, table.schema)
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    return _report_coverage(coverage, keys)
 
 class mapRef():
-    def __init__(self, mappings_url, zip_path = None, file_path = None, ):
-        # load the CSV file and reference mappings
-        request = httpx.request("GET", mappings_url)
-        self.tecr_refs = read_csv(StringIO(request.content.decode("UTF-8")))
-        if zip_path is not None:
-            with ZipFile(zip_path, 'r') as zip:
-                df = read_csv(zip.extract('amalgamated_TECR_scrape.csv'))
-                os.remove('amalgamated_TECR_scrape.csv')
-        elif file_path is not None:
-            with open(file_path, 'r') as file:
-                df = read_csv(file)     
-        else:
+    def __init__(self, mappings_url = None, zip_path = None, file_path = None, mappings_path = None, snapshot_path = 'TECRDB/references_with_abstracts.csv', offline = False):
+        # the reference mappings and TECR data are loaded when they are first used
+        if zip_path is None and file_path is None:
             raise TypeError('The TECR data must be specified to complete mapping.')
+        if mappings_url is None and mappings_path is None:
+            raise TypeError('The reference mappings must be specified as a URL or a local CSV.')
+        if offline and mappings_path is None:
+            raise TypeError('The offline mapping requires the local CSV of the reference mappings.')
+        self.mappings_url, self.mappings_path = mappings_url, mappings_path
+        self.zip_path, self.file_path = zip_path, file_path
+        self.snapshot_path, self.offline = snapshot_path, offline
+        
+    @cached_property
+    def tecr_refs(self):
+        # load the reference mappings from the local CSV, or else from the URL
+        if self.mappings_path is not None:
+            return read_csv(self.mappings_path)
+        request = httpx.request("GET", self.mappings_url)
+        return read_csv(StringIO(request.content.decode("UTF-8")))
+    
+    @cached_property
+    def tecrdb(self):
+        # load the CSV file
+        if self.zip_path is not None:
+            df = load_dataset(self.zip_path, member = 'amalgamated_TECR_scrape.csv')
+        else:
+            df = load_dataset(self.file_path)
         df = df.fillna(' ') # prevents spill-over of text
         df = df.astype(str)
         for column in df:
@@ -30,54 +99,55 @@ class mapRef():
                 del df[column]
             # if column =='Reference ID:':
             #     df[column] = [re.sub('(_.+)', '', str(entry)) for entry in self.tecrdb[df]]
-        self.tecrdb = df
+        return df
+    
+    def _archived(self):
+        if self.zip_path is None:
+            return []
+        with ZipFile(self.zip_path, 'r') as zip:
+            return [member for member in archive_members if member in zip.namelist()]
+    
+    def _snapshot(self):
+        # the references of a previous mapping, which resolve their PMIDs without PubMed
+        if self.snapshot_path is not None and os.path.exists(self.snapshot_path):
+            snapshot = load_dataset(self.snapshot_path, **archive_members['references_with_abstracts.csv'])
+        elif 'references_with_abstracts.csv' in self._archived():
+            snapshot = load_dataset(self.zip_path, member = 'references_with_abstracts.csv', **archive_members['references_with_abstracts.csv'])
+        else:
+            return {}
+        snapshot = snapshot.rename(columns = {'doi_from_pubmed': 'doi'}).dropna(subset = ['pmid']).drop_duplicates('pmid')
+        snapshot['year'] = snapshot['year'].astype('Int64')
+        snapshot = snapshot[reference_fields].astype('object')
+        snapshot = snapshot.where(snapshot.notna(), None)
+        return {row[0]: row for row in snapshot.itertuples(index = False, name = None)}
+        
+    def apply(self, reference_ids_column, doi_column, pmid_column, export = False, chunk_size = CHUNK_SIZE, cache_path = 'references_cache.sqlite', ttl = TTL, **fetch_arguments):
+        # read the archived members in parallel, which the lazy loaders then take from the dataset cache
+        if self.zip_path is not None:
+            load_members(self.zip_path, {member: archive_members[member] for member in self._archived()})
         
-    def apply(self, reference_ids_column, doi_column, pmid_column, export = False):
         # load references from PubMed
         tecr_refs_with_pubmed_id = self.tecr_refs[~isnull(self.tecr_refs.pmid)].copy()  # NOT null entries
         tecr_refs_with_pubmed_id["pmid"] = tecr_refs_with_pubmed_id.pmid.astype(int).astype(str) # remove decimals
         print(f"Collected {tecr_refs_with_pubmed_id.shape[0]} PubMed IDs")
 
-        # parse the references for DOIs
-        pubmed = PubMed(tool="MyTool", email="elad.noor@weizmann.ac.il")
-        data = []
-        count = 0
-        for rows in chunked(tecr_refs_with_pubmed_id.itertuples(), 100):
-            print(f'{count}/{tecr_refs_with_pubmed_id.shape[0]} references are mapped.', end='\r')
-            pubmed_ids = " ".join([str(row.pmid) for row in rows])
-            results = pubmed.query(pubmed_ids)
-            for paper in results:
-                try:
-                    doi = paper.pubmed_doi
-                except AttributeError:
-                    doi = None
-
-                pmid = str(paper.pubmed_id.split("\n")[0])
-                authors = ", ".join([author["lastname"] + (" " + author["firstname"] if author["firstname"] else "") for author in paper.authors])
-                data.append((pmid, doi, paper.publication_date.year, authors, paper.abstract))
-            count += len(rows)
+        # parse the references for DOIs, from the local cache or concurrently from PubMed
+        data = resolve_references(tecr_refs_with_pubmed_id.pmid, cache_path, ttl, self._snapshot(), self.offline, chunk_size = chunk_size, **fetch_arguments)
 
         # export the parsed information into a new CSV
-        mappings = DataFrame(data=data, columns=["pmid", "doi", "year", "authors", "abstract"])
+        mappings = DataFrame(data=data, columns=reference_fields)
         self.mappings = mappings.join(tecr_refs_with_pubmed_id.set_index("pmid"), on="pmid", lsuffix="_from_pubmed", rsuffix="_from_Robert")
         
-        # DOI and PMID columns are added to the TECRDB file
-        new_column = [' ' for row in range(len(self.tecrdb))]
-        self.tecrdb.insert(4, 'PMID', new_column)
-        self.tecrdb.insert(5, 'DOI', new_column)
-
-        references_added = 0
-        for index, row in self.mappings.iterrows():
-            if (row['pmid'] or row[doi_column]) != ' ':
-                matching_master_subset = self.tecrdb.loc[self.tecrdb['Reference ID:'] == row[reference_ids_column]]
-                for master_index, match in matching_master_subset.iterrows():
-                    self.tecrdb.at[master_index, 'PMID'] = self.mappings.at[index, pmid_column]
-                    self.tecrdb.at[master_index, 'DOI'] = self.mappings.at[index, doi_column]
-                    references_added += 1
-        print(f'References added to {references_added} datums')
+        # DOI and PMID columns are added to the TECRDB file by a keyed join on the reference code
+        keys = reference_keys(self.mappings, reference_ids_column, pmid_column, doi_column)
+        table, coverage = join_references(pa.Table.from_pandas(self.tecrdb, preserve_index = False), keys)
+        self.tecrdb = table.to_pandas()
+        self.coverage = _report_coverage(coverage, keys)
 
         # export the dataframe
-        self.tecrdb.to_csv('mapped_TECRDB_scrape.csv')
+        write_table(self.tecrdb, 'mapped_TECRDB_scrape.parquet')
+        if os.path.exists('TECRDB'):
+            os.replace('mapped_TECRDB_scrape.parquet', 'TECRDB/mapped_TECRDB_scrape.parquet')
         self.mappings.to_csv("references_with_abstracts.csv")
         with ZipFile('TECRDB.zip', 'a', compression = ZIP_LZMA) as zip:
             for file in ['mapped_TECRDB_scrape.csv', "references_with_abstracts.csv"]:
@@ -5,136 +5,317 @@ Created on Mon May 16 09:24:58 2022
 @author: Andrew Freiburger
 """
 from requests.packages.urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
-from pandas import DataFrame, read_csv, concat
+from pandas import DataFrame, read_csv
 from zipfile import ZipFile #, ZIP_LZMA
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from warnings import warn
 from shutil import move
-from time import sleep
-import requests
+from urllib.parse import urlsplit
+from hashlib import sha256
+from lxml import etree
+from storage import write_table, load_dataset
+from time import monotonic, time
+from tempfile import NamedTemporaryFile
+import requests, aiohttp, asyncio
 import numpy
 import math, json, os, re
 
+# stream the reference ids, enzyme names, and reactions from the rows of the search index
+def _parse_index(index_path):
+    for _, row in etree.iterparse(index_path, events = ('end',), tag = 'tr', html = True):
+        cells = {element.get('id', '').rpartition('_')[0]: element for element in row.iter('a', 'span')}
+        if 'MainBody_gvSearch_lbSearch' in cells:
+            yield tuple(''.join(cells[name].itertext()) for name in [
+                'MainBody_gvSearch_lbSearch', 'MainBody_gvSearch_lblEnzyme', 'MainBody_gvSearch_lblReaction'])
+            
+        # release the parsed rows
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+# parse the information and the measurement tables of a reference page
+def _parse_details(page):
+    bs = BeautifulSoup(page, 'lxml', parse_only = SoupStrainer("table", attrs = {"id": ["MainBody_DataList1", "MainBody_extraData"]}))
+    
+    ## first set of information 
+    tables = bs.find_all("table", attrs={"id": "MainBody_DataList1"})
+    if len(tables) == 0:
+        return None, None
+    each_row2 = []
+    for row in tables[0].find_all("tr")[1:]:
+        for row_element in row.find_all("td"):
+            each_row2.append(re.sub("(\xa0)|(\n)|,","",row_element.text))
+    
+    ## second set of information 
+    tables1 = bs.find_all("table", attrs = {"id": "MainBody_extraData"})
+    if len(tables1) != 1:
+        return each_row2, None
+    body1 = tables1[0].find_all("tr")
+    heads, body_rows1 = body1[0], body1[1:]
+    headings = [(head.text).rstrip("\n") for head in heads.find_all("th")]
+    total_rows = []
+    for row in body_rows1:
+        total_rows.append([re.sub("(\xa0)|(\n)|,","",row_element.text) for row_element in row.find_all("td")])
+    return each_row2, (headings, total_rows)
+
+# run a coroutine, also from within the running event loop of a notebook
+def _run(coroutine):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, coroutine).result()
+
+class _HostThrottle():
+    def __init__(self, requests_per_second):
+        self.interval = 1/requests_per_second if requests_per_second else 0
+        self.next_request = {}
+        self.lock = asyncio.Lock()
+        
+    async def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        async with self.lock:
+            now = monotonic()
+            slot = max(now, self.next_request.get(host, now))
+            self.next_request[host] = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+# collect the parsed rows as records over a growing union of columns
+class _RowAccumulator():
+    def __init__(self):
+        self.columns = {}
+        self.records, self.index = [], []
+        
+    def extend(self, records, index_start):
+        for record in records:
+            self.columns.update(dict.fromkeys(record))
+        self.records.extend(records)
+        self.index.extend(range(index_start, index_start+len(records)))
+        
+    def to_dataframe(self):
+        return DataFrame.from_records(self.records, index = self.index, columns = list(self.columns))
+
+# replace the file with its complete content, so that the concurrent readers and an interrupted write never see a partial file
+def _atomic_write(path, content):
+    with NamedTemporaryFile('w', encoding = 'utf-8', dir = os.path.dirname(path), suffix = '.tmp', delete = False) as out:
+        out.write(content)
+    os.replace(out.name, path)
+
+# content-addressed store of the reference pages, with a manifest of the scraping progress
+class _PageCache():
+    def __init__(self, directory, max_age = None, checkpoint_every = 25):
+        self.directory = directory
+        self.max_age = max_age
+        self.started = time()
+        self.checkpoint_every = checkpoint_every
+        self.unsaved = 0
+        for folder in ['pages', 'parsed']:
+            os.makedirs(os.path.join(directory, folder), exist_ok = True)
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.entries = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as manifest:
+                self.entries = json.load(manifest)
+                
+    def _path(self, folder, digest):
+        return os.path.join(self.directory, folder, digest + ('.html' if folder == 'pages' else '.json'))
+                
+    def fresh(self, id_value):
+        entry = self.entries.get(id_value)
+        if entry is None or not os.path.exists(self._path('parsed', entry['sha256'])):
+            return False
+        # without max_age, each cached page is revalidated once per run with a conditional request
+        if self.max_age is None:
+            return entry['checked'] >= self.started
+        return time() - entry['checked'] < self.max_age
+    
+    def validators(self, id_value):
+        headers = {}
+        if id_value in self.entries and os.path.exists(self._path('pages', self.entries[id_value]['sha256'])):
+            if self.entries[id_value]['etag']:
+                headers['If-None-Match'] = self.entries[id_value]['etag']
+            if self.entries[id_value]['last_modified']:
+                headers['If-Modified-Since'] = self.entries[id_value]['last_modified']
+        return headers
+    
+    def store(self, id_value, page, headers):
+        digest = sha256(page.encode('utf-8')).hexdigest()
+        if not os.path.exists(self._path('pages', digest)):
+            _atomic_write(self._path('pages', digest), page)
+        self.entries[id_value] = {
+            'sha256': digest, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'), 'checked': time()
+            }
+        self._saved()
+        
+    def revalidated(self, id_value):
+        self.entries[id_value]['checked'] = time()
+        self._saved()
+        
+    def parsed(self, id_value):
+        # the parsed tables are shared by every reference with the same page content
+        digest = self.entries[id_value]['sha256']
+        if os.path.exists(self._path('parsed', digest)):
+            with open(self._path('parsed', digest), 'r', encoding = 'utf-8') as parsed:
+                return json.load(parsed)
+        with open(self._path('pages', digest), 'r', encoding = 'utf-8') as page:
+            tables = _parse_details(page.read())
+        _atomic_write(self._path('parsed', digest), json.dumps(tables))
+        return tables
+        
+    def _saved(self):
+        self.unsaved += 1
+        if self.unsaved >= self.checkpoint_every:
+            self.checkpoint()
+        
+    def checkpoint(self):
+        _atomic_write(self.manifest_path, json.dumps(self.entries, indent = 1))
+        self.unsaved = 0
+
+def _datum(record):
+    return {col: val for col, val in record.items() if val not in [' ', '']}
+
+# the age in seconds after which the cached pages of an incremental scrape are revalidated with the server
+incremental_max_age = 7*24*3600
+
+# group the rows of a previous scrape by their reference
+def _previous_references(scrape_path):
+    scrape = load_dataset(scrape_path, dtype = 'object', keep_default_na = False, index_col = 0)
+    scrape = scrape.drop(columns = ['index.1'], errors = 'ignore')
+    scrape = scrape.drop(columns = [col for col in scrape.columns if (scrape[col] == '').all()])  # columns from the reindexing
+    previous = {}
+    for index, row in zip(scrape.index.astype(int), scrape.to_dict('records')):
+        if row['Reference ID:'] != ' ':
+            reference = previous[row['Reference ID:']] = {'indices': [], 'records': []}
+        reference['indices'].append(index)
+        reference['records'].append({col: val for col, val in row.items() if val != ' '})
+    return previous
+
 class TECRDB():
     def __init__(self, printing = True):
         # defining the website
         self.printing = printing
         
-    def scrape(self,):
-        root_url = "https://randr.nist.gov/enzyme/DataDetails.aspx?ID="
+    def scrape(self, workers = 1, requests_per_second = None, parsers = 4, cache_path = 'TECR_scraping', max_age = None, 
+               incremental = False, root_url = "https://randr.nist.gov/enzyme/DataDetails.aspx?ID="):
         end_url = "&finalterm=&data=enzyme"
         
-        # identify the table and rows of pertinent data
-        with open(os.path.join(os.path.dirname(__file__), 'Enzyme Thermodynamic Database.html'), 'r') as tecr_home_page:
-            bs = BeautifulSoup(tecr_home_page, 'lxml')
-        body = bs.find("table", attrs = {'id': 'MainBody_gvSearch'}).find_all("tr")
-        total_entries = math.floor(1*len(body))
+        # identify the reference ids, reaction names, and strings 
+        index_path = os.path.join(os.path.dirname(__file__), 'Enzyme Thermodynamic Database.html')
+        references = [(id_value, root_url + id_value + end_url, enzyme_name, reaction) 
+                      for id_value, enzyme_name, reaction in _parse_index(index_path)]
+        total_entries = len(references) + 1
 
-        # defining the boundaries of the dataframe section
+        # cached pages are revalidated with the server through their ETag and Last-Modified headers, in every run or once they are older than max_age seconds, or a week in an incremental scrape
+        if incremental and max_age is None:
+            max_age = incremental_max_age
+        cache = _PageCache(cache_path, max_age) if cache_path is not None else None
+        
+        # only new references, and previous references whose cached page is stale or absent, are fetched in an incremental scrape
+        previous = {}
+        if incremental and os.path.exists('TECRDB/TECRDB_scrape.csv'):
+            previous = _previous_references('TECRDB/TECRDB_scrape.csv')
+        previous_digests = {}
+        fetched = []
+        for id_value, total_url, enzyme_name, reaction in references:
+            if id_value not in previous:
+                fetched.append((id_value, total_url))
+            elif cache is not None and not cache.fresh(id_value):
+                if id_value in cache.entries:
+                    previous_digests[id_value] = cache.entries[id_value]['sha256']
+                fetched.append((id_value, total_url))
+        if previous and cache is None:
+            warn('CacheWarning: The previous references are reused without the page cache, so corrections to their pages are not detected.')
+        ids = [reference[0] for reference in fetched]
+        urls = [reference[1] for reference in fetched]
+        
+        reused = {id_value: reference['records'] for id_value, reference in previous.items() if id_value not in ids}
+        try:
+            self._assemble(references, total_entries, self._fetch_pages(ids, urls, cache, workers, requests_per_second, parsers), reused)
+        finally:
+            if cache is not None:
+                cache.checkpoint()
+        
+        # the changes of the splice are exported for the downstream merging and JSON export
+        if incremental:
+            modified = [id_value for id_value, digest in previous_digests.items() if cache.entries[id_value]['sha256'] != digest]
+            self.changelog = self._changelog(previous, modified)
+            # the reused references were revalidated within max_age seconds, or never without the page cache
+            self.changelog['max_age'] = max_age if cache is not None else None
+            self.changelog['unverified'] = sorted(reused) if cache is None else []
+            with open('TECRDB/TECRDB_scrape_changelog.json', 'w') as output:
+                json.dump(self.changelog, output, indent = 4)
+        
+    def _fetch_pages(self, ids, urls, cache, workers, requests_per_second, parsers):
+        if workers > 1:
+            return _run(self._concurrent_scrape(ids, urls, cache, workers, requests_per_second, parsers))
+        
         # open the requests session
         session = requests.Session()
         adapter = HTTPAdapter(max_retries = Retry(connect=3, backoff_factor=0.5))
         session.mount('https://', adapter)
-
-        # loop through the enzyme id values 
-        if not os.path.exists('TECR_scraping'):
-            os.mkdir('TECR_scraping')
-
-        index_count = loop_count = name_iteration = 0
-        entry_dfs = []
-        for id_row in range(1, total_entries):   
-            id_value = body[id_row].find("a").text
-            total_url = root_url + id_value + end_url
-            bs = BeautifulSoup(session.get(total_url).text, 'lxml')
-            
-            # parsing the reaction names and strings   
-            enzyme_name = body[id_row].find('span', attrs = {'id': 'MainBody_gvSearch_lblEnzyme_%s' %(name_iteration)}).text
-            reaction = body[id_row].find('span', attrs = {'id': 'MainBody_gvSearch_lblReaction_%s' %(name_iteration)}).text
-            name_iteration += 1
+        session.mount('http://', adapter)
+        def fetch_and_parse(id_value, url):
+            if cache is None:
+                return _parse_details(session.get(url).text)
+            if cache.fresh(id_value):
+                return cache.parsed(id_value)
+            response = session.get(url, headers = cache.validators(id_value))
+            if response.status_code == 304:
+                cache.revalidated(id_value)
+            elif response.status_code == 200:
+                cache.store(id_value, response.text, response.headers)
+            else:
+                return _parse_details(response.text)
+            return cache.parsed(id_value)
+        
+        return (fetch_and_parse(id_value, url) for id_value, url in zip(ids, urls))
+        
+    def _assemble(self, references, total_entries, parsed_pages, reused = {}):
+        index_count = 0
+        accumulator = _RowAccumulator()
+        self.reference_rows = {}
+        parsed_pages = iter(parsed_pages)
+        for id_row, (id_value, total_url, enzyme_name, reaction) in enumerate(references, 1):
+            if id_value in reused:
+                self.reference_rows[id_value] = (index_count, reused[id_value])
+                accumulator.extend(reused[id_value], index_count)
+                index_count += len(reused[id_value])
+                continue
+            each_row2, extra_data = next(parsed_pages)
             
             ## first set of information 
-            tables = bs.find_all("table", attrs={"id": "MainBody_DataList1"})
-            if len(tables) == 0:
+            if each_row2 is None:
                 warn(f'TECRError: The {id_value} reference {total_url} does not possess data.')
                 continue
-            body2 = tables[0].find_all("tr")
-            body_rows2 = body2[1:]        
-            information_entries_list, information_values_list, each_row2 = [], [], []
-            for row in range(len(body_rows2)):
-                for row_element in body_rows2[row].find_all("td"):
-                    row_refined2 = re.sub("(\xa0)|(\n)|,","",row_element.text)
-                    each_row2.append(row_refined2)
-
-            column_count = 0
-            for i, element in enumerate(each_row2):
-                if i == 0 or i % 2 == 0:
-                    information_entries_list.append(element)
-                    column_count += 1
-                else:
-                    information_values_list.append(element)
-                    column_count += 1
-            column_count /= 2  #!!! why is the column count halved?
-            
-            table_df2 = DataFrame(
-                data = [information_values_list], columns = information_entries_list, index = range(index_count, index_count+1)
-                )
-            table_df2.drop([table_df2.columns[-2], table_df2.columns[-1]], axis=1, inplace=True)
+            information_entries_list, information_values_list = each_row2[0::2], each_row2[1::2]
+            information = dict(zip(information_entries_list[:-2], information_values_list[:-2]))
             
             ## second set of information 
-            tables1 = bs.find_all("table", attrs = {"id": "MainBody_extraData"})
-            if len(tables1) != 1:
+            if extra_data is None:
                 warn(f'The {id_value} reference {total_url} possesses an unexpected data structure.')
                 continue
             if self.printing:
                 print(id_value, f'\t\t{id_row}/{total_entries} enzymes', 
                       f'\t\t{index_count} datums', '\t\t\t\t', end = '\r')
-            body1 = tables1[0].find_all("tr")
-            heads, body_rows1 = body1[0], body1[1:]
-            headings = ['Enzyme:', 'Reaction:']
-            for head in heads.find_all("th"):
-                head = (head.text).rstrip("\n")
-                headings.append(head)
-        
-            total_rows = []
-            for row_number in range(len(body_rows1)):
-                each_row = [enzyme_name, reaction]
-                for row_element in body_rows1[row_number].find_all("td"):
-                    row_refined = re.sub("(\xa0)|(\n)|,","",row_element.text)
-                    each_row.append(row_refined)
-                total_rows.append(each_row)
-            
-            table_df1 = DataFrame(
-                data = total_rows, columns = headings, index = range(index_count, len(body_rows1)+index_count)
-                )
-            table_df1.drop(table_df1.columns[len(table_df1.columns)-1], axis=1, inplace=True)
+            headings, body_rows1 = extra_data
+            headings = ['Enzyme:', 'Reaction:'] + headings[:-1]
+            records = [dict(zip(headings, [enzyme_name, reaction] + row)) for row in body_rows1]
             
-            # merge current and existing dataframes 
-            this_dataframe = table_df1.join(table_df2)
-            this_dataframe.index.name = 'index'
-            if loop_count == 0:
-                old_dataframe = this_dataframe
-                old_dataframe.index.name = 'index'
-            elif loop_count > 0:
-                common_columns = list(set(this_dataframe.columns) & set(old_dataframe.columns))  # intersection operator
-                current_dataframe = old_dataframe.merge(this_dataframe, on = common_columns, how = 'outer')
-                old_dataframe = current_dataframe  
-                
-            # export the dataframe 
+            # the reference information is only stated on the first row of each reference
+            if records:
+                records[0].update(information)
+            self.reference_rows[id_value] = (index_count, records)
+            accumulator.extend(records, index_count)
             index_count += len(body_rows1)
-            time_delay = max_referenes_per_csv = 0
-            sleep(time_delay)
-            if loop_count == max_referenes_per_csv:
-                # id_value = re.sub('(/)', '-', id_value)
-                # while os.path.exists(os.path.join('TECR_scraping', f'{id_value}_{output_loop}.csv')):
-                #     output_loop += 1
-                entry_dfs.append(old_dataframe)
-                loop_count = 0 
-            else:        
-                loop_count += 1 
                 
-        # combine all of the dataframes
-        combined_df = concat(entry_dfs)
+        # combine all of the rows
+        combined_df = accumulator.to_dataframe()
+        combined_df.index.name = 'index'
         if self.printing:
             display(combined_df)
         
@@ -142,7 +323,7 @@ class TECRDB():
         combined_df = combined_df.fillna(' ') # prevents spill-over of text
         middle_dataframe_columns = ['T(K)', 'pH ', 'K<sub>c</sub>\' ', 'δ<sub>r</sub>H\'<sup>o</sup>(kJ.mol<sup>-1</sup>)', 'Km\'']
         left_dataframe_columns = ['index', 'Enzyme:', 'EC Value:', 'Reaction:', 'Reference:', 'Reference ID:'] 
-        right_dataframe_columns = list(set(combined_df.columns) - set(left_dataframe_columns) - set(middle_dataframe_columns))
+        right_dataframe_columns = [col for col in combined_df.columns if col not in left_dataframe_columns + middle_dataframe_columns]
         self.scraped_df = combined_df.reindex(
             columns = left_dataframe_columns + middle_dataframe_columns + right_dataframe_columns
             )
@@ -150,42 +331,99 @@ class TECRDB():
         # export the dataframe
         if not os.path.exists('TECRDB'):
             os.mkdir('TECRDB')
-        self.scraped_df.to_csv('TECRDB/TECRDB_scrape.csv')
+        write_table(self.scraped_df, 'TECRDB/TECRDB_scrape.parquet')
         # with ZipFile('TECRDB.zip', 'w', compression = ZIP_LZMA) as zip:
         #     zip.write('TECRDB_scrape.csv')
         #     os.remove('TECRDB_scrape.csv')
 
-    def amalgamate(self, zip_path = None):
-        def merge_cells(re_search, col_name, printed):
-            if re.search(re_search, this_column):
-                solute = re.search(re_search, this_column).group(1)
-                if row[this_column] not in [' ', '?']:
-                    if row[col_name] == ' ':
-                        df.at[index, this_column] = str(row[this_column]) + ' ' + solute
-                    if row[this_column] != ' ':
-                        if row[col_name] != (row[this_column] or str(row[this_column]) + ' ' + solute):
-                            df.at[index, this_column] = str(row[col_name])+' & '+str(row[this_column])+' '+solute
-                if this_column !=  col_name:
-                    if not printed:
-                        print('combined\t', this_column)
-                        printed = True
-                    combined_columns.add(this_column)
-                    
-            return printed
+    def _changelog(self, previous, modified):
+        changelog = {
+            'references': {'added': [], 'removed': [], 'modified': modified},
+            'datums': {'added': [], 'removed': [], 'modified': []},
+            'index_map': {}
+            }
+        for id_value, (index_start, records) in self.reference_rows.items():
+            if id_value not in previous:
+                changelog['references']['added'].append(id_value)
+                changelog['datums']['added'].extend(range(index_start, index_start+len(records)))
+        for id_value, reference in previous.items():
+            if id_value not in self.reference_rows:
+                changelog['references']['removed'].append(id_value)
+                changelog['datums']['removed'].extend(reference['indices'])
+                continue
+            
+            # the datums of each reference are paired in their order on the page
+            index_start, records = self.reference_rows[id_value]
+            for row, record in enumerate(records):
+                new_index = index_start + row
+                if row >= len(reference['indices']):
+                    changelog['datums']['added'].append(new_index)
+                    continue
+                changelog['index_map'][reference['indices'][row]] = new_index
+                if _datum(record) != _datum(reference['records'][row]):
+                    changelog['datums']['modified'].append([reference['indices'][row], new_index])
+            changelog['datums']['removed'].extend(reference['indices'][len(records):])
+            
+            # the references without a previous cached page are modified where their datums changed
+            changed = len(records) != len(reference['records']) or any(_datum(record) != _datum(old) for record, old in zip(records, reference['records']))
+            if changed and id_value not in changelog['references']['modified']:
+                changelog['references']['modified'].append(id_value)
+        return changelog
+
+    async def _concurrent_scrape(self, ids, urls, cache, workers, requests_per_second, parsers):
+        # mirror the Retry(connect=3, backoff_factor=0.5) of the sequential session
+        async def fetch(session, url, headers):
+            for attempt in range(4):
+                await throttle.wait(url)
+                try:
+                    async with session.get(url, headers = headers) as response:
+                        return response.status, await response.text(), response.headers
+                except aiohttp.ClientConnectorError:
+                    if attempt == 3:
+                        raise
+                    if attempt > 0:
+                        await asyncio.sleep(0.5 * 2**(attempt-1))
+                        
+        async def fetch_and_parse(session, id_value, url):
+            if cache is not None and cache.fresh(id_value):
+                return await loop.run_in_executor(parser_pool, cache.parsed, id_value)
+            async with workers_semaphore:
+                status, page, headers = await fetch(session, url, cache.validators(id_value) if cache is not None else {})
+            if cache is None or status not in [200, 304]:
+                return await loop.run_in_executor(parser_pool, _parse_details, page)
+            if status == 304:
+                cache.revalidated(id_value)
+            else:
+                cache.store(id_value, page, headers)
+            return await loop.run_in_executor(parser_pool, cache.parsed, id_value)
         
+        loop = asyncio.get_running_loop()
+        throttle = _HostThrottle(requests_per_second)
+        workers_semaphore = asyncio.Semaphore(workers)
+        connector = aiohttp.TCPConnector(limit_per_host = workers)
+        with ThreadPoolExecutor(parsers) as parser_pool:
+            async with aiohttp.ClientSession(connector = connector) as session:
+                return await asyncio.gather(*[fetch_and_parse(session, id_value, url) for id_value, url in zip(ids, urls)])
+
+    def amalgamate(self, zip_path = None):
         # import the scraped data
         if not os.path.exists('TECRDB'):
             os.mkdir('TECRDB')
         if zip_path == None:
-            df = read_csv(os.path.join('TECRDB/TECRDB_scrape.csv'))
+            df = load_dataset(os.path.join('TECRDB/TECRDB_scrape.csv'))
         elif zip_path:  
-            with ZipFile(zip_path, 'r') as zip:
-                df = read_csv(zip.extract('TECRDB_scrape.csv'))
+            df = load_dataset(zip_path, member = 'TECRDB_scrape.csv')
         df = df.fillna(' ') # prevents spill-over of text
         df = df.astype(str)
         if os.path.exists('TECRDB_scrape.csv'):
             move('TECRDB_scrape.csv', 'TECRDB/TECRDB_scrape.csv')
         
+        # copy entries across all rows of each reference
+        reference_rows = df['Reference ID:'] != ' '
+        reference_values = df[reference_rows].iloc[reference_rows.cumsum() - 1]
+        reference_values.index = df.index
+        df = df.where(df != ' ', reference_values)
+        
         combined_columns = set()
         re_searches = {
             '(?<=c\()(\w+\d?\+?)(?<!,)': 'c(glycerol,mol dm<sup>-3</sup>)',
@@ -195,63 +433,56 @@ class TECRDB():
             '(?i)(?!Km\' )(^K)': 'K<sub>c</sub>\' ', 
             '(Km\')(?! )':'Km\' ',
             }
+        column_searches = {
+            column: [(re.search(re_search, column).group(1), col_name) for re_search, col_name in re_searches.items() if re.search(re_search, column)]
+            for column in df
+            }
         print('\nColumns:\n', '='*len('Columns:'))
         for this_column in df:
             printed = False
             if 'index' in this_column:
                 continue
-            for index, row in df.iterrows():
-                # copy entries across all rows
-                if row['Reference ID:'] != ' ':
-                    reference_row = row
-                else:
-                    for row_col, val in row.iteritems():
-                        if val == ' ':
-                            df.at[index, row_col] = reference_row[row_col]
-                
-                # combine similar columns
-                for re_search, col_name in re_searches.items():
-                    printed = merge_cells(re_search, col_name, printed)
-                if this_column == 'EC Value:':
-                    ecs = []
-                    for ec in row[this_column].split('&'):
-                        if not re.search('((\d+\.)+(\d+|\-)?)', row[this_column]):
-                            df.at[index, this_column] = ' '
-                            break
-                        ecs.append(re.search('((\d+\.)+(\d+|\-)?)', row[this_column]).group().strip())
-                    if df.at[index, this_column] != ' ':
-                        df.at[index, this_column] = ' & '.join(ecs)
-                elif this_column in ['buffer(mol dm<sup>-3</sup>)', 'buffer and/or salt ', 'media ', 'buffer ']:
-                    if not printed:
-                        print('combined\t', this_column)
-                        printed = True
-                    if row[this_column] not in [' ', '?']:
-                        if row['Buffer:'] == ' ':
-                            df.at[index, 'Buffer:'] = row[this_column]
-                        if row['Buffer:'] != ' ':
-                            if not re.search(row[this_column], row['Buffer:']):
-                                df.at[index, 'Buffer:'] = str(row['Buffer:']) + ' + ' + row[this_column]
-                    combined_columns.add(this_column)
-                elif this_column in ['salt ', 'cosolvent ', 'added solute ', 'protein ', 'added solute ', 
-                                   'percent(dimethyl sulfoxide) ', 'p(MPa)']:
+            values = df[this_column]
+            entered = ~values.isin([' ', '?'])
+            
+            # combine similar columns
+            for solute, col_name in column_searches[this_column]:
+                merged = entered & (df[col_name] != values)
+                df[this_column] = df[this_column].where(~merged, df[col_name] + ' & ' + values + ' ' + solute)
+                if this_column != col_name:
                     if not printed:
                         print('combined\t', this_column)
                         printed = True
-                    if row[this_column] not in [' ', '?']:
-                        if ['solvent '] == ' ':
-                            df.at[index, 'solvent '] = row[this_column]
-                            if this_column == 'p(MPa)':
-                                df.at[index, 'solvent '] += ' MPa'  
-                            elif this_column == 'percent(dimethyl sulfoxide) ':
-                                df.at[index, 'solvent '] += ' % DMSO'   
-                        else:
-                            if not re.search(row[this_column], row['solvent ']):
-                                df.at[index, 'solvent '] = row['solvent '] + '  +  ' + row[this_column]
                     combined_columns.add(this_column)
-                else:
-                    if not printed:
-                        print('not combined\t', this_column)
-                        printed = True
+            if this_column == 'EC Value:':
+                # the first EC of each entry is repeated for every listed EC
+                ec = values.str.extract(r'((\d+\.)+(\d+|\-)?)')[0].str.strip()
+                repeated_ecs = (ec + ' & ').str.repeat(values.str.count('&') + 1).str[:-3]
+                df[this_column] = repeated_ecs.where(ec.notna(), ' ')
+            elif this_column in ['buffer(mol dm<sup>-3</sup>)', 'buffer and/or salt ', 'media ', 'buffer ']:
+                if not printed:
+                    print('combined\t', this_column)
+                    printed = True
+                buffers = df['Buffer:']
+                empty = buffers == ' '
+                appended = entered & ~empty
+                appended[appended] = [not re.search(value, buffer) for value, buffer in zip(values[appended], buffers[appended])]
+                df['Buffer:'] = buffers.mask(entered & empty, values).mask(appended, buffers + ' + ' + values)
+                combined_columns.add(this_column)
+            elif this_column in ['salt ', 'cosolvent ', 'added solute ', 'protein ', 'added solute ', 
+                               'percent(dimethyl sulfoxide) ', 'p(MPa)']:
+                if not printed:
+                    print('combined\t', this_column)
+                    printed = True
+                solvents = df['solvent ']
+                appended = entered.copy()
+                appended[appended] = [not re.search(value, solvent) for value, solvent in zip(values[appended], solvents[appended])]
+                df['solvent '] = solvents.mask(appended, solvents + '  +  ' + values)
+                combined_columns.add(this_column)
+            else:
+                if not printed:
+                    print('not combined\t', this_column)
+                    printed = True
                         
         # delete the combined columns and export
         print('\nCombined columns:')
@@ -277,77 +508,59 @@ class TECRDB():
             }, inplace = True)
         
         self.amalgamated_df = df
-        self.amalgamated_df.to_csv("TECRDB/amalgamated_TECRDB_scrape.csv") 
+        write_table(self.amalgamated_df, 'TECRDB/amalgamated_TECRDB_scrape.parquet')
             
-        # count down for processing and organizing the data
-        def assign_values(col, reference_list, values_list, temperatures_list, ph_list, added):
-            reference_list.append(False)   
-            if row[col] != ' ':
-                cleaned_keq = re.search('(\-?\d+\.?\d*)', str(row[col])).group()
-                values_list.append(float(cleaned_keq)) 
-                reference_list[-1] = True
-                if not added:
-                    temperatures.append(row['T [K]'])
-                    ph_list.append('nan')
-                    if row['pH'] != ' ':
-                        ph_list[-1] = row['pH']
-                    added = True
-                        
-            return reference_list, values_list, temperatures_list, ph_list, added
-        
         # acquire a list of all enzymes
-        enzyme_list = []
-        for index, row in df.iterrows():
-            if row['Enzyme:'] not in enzyme_list and row['Enzyme:'] != ' ':
-                enzyme_list.append(row['Enzyme:'])            
+        labeled = df['Enzyme:'] != ' '
+        enzyme_list = df.loc[labeled, 'Enzyme:'].drop_duplicates()
         enzymes = [re.search('(\w.*)',original_enzyme).group() for original_enzyme in enzyme_list]
+        
+        # assign the rows to their enzymes, where each row is counted again for each unlabeled row that follows it
+        matched = df['Enzyme:'].isin([' '+enzyme for enzyme in enzymes])
+        blocks = labeled.cumsum()
+        rows = df[matched]
+        measurements = rows.loc[rows.index.repeat(blocks.map(blocks.value_counts())[matched])]
+        row_groups = rows.groupby('Enzyme:', sort = False).indices
+        measurement_groups = measurements.groupby('Enzyme:', sort = False).indices
+        
+        # parse the values of each column in one pass
+        reactions, references = rows['Reaction:'].to_numpy(), rows['Reference:'].to_numpy()
+        entered, values = {}, {}
+        for col in ['Keq', 'Km\'', 'Enthalpy [kJ/mol]']:
+            entered[col] = (measurements[col] != ' ').to_numpy()
+            values[col] = measurements[col].str.extract(r'(\-?\d+\.?\d*)')[0].astype(float).to_numpy()
+        measured = entered['Keq'] | entered['Km\''] | entered['Enthalpy [kJ/mol]']
+        temperatures, phs = measurements['T [K]'].to_numpy(), measurements['pH'].to_numpy()
+        
+        def statistics(col, positions):
+            column_entered = entered[col][positions]
+            column_values = values[col][positions][column_entered]
+            if len(column_values) == 0:
+                return column_entered.tolist(), [], 'nan', 'nan'
+            return column_entered.tolist(), column_values.tolist(), numpy.mean(column_values), numpy.std(column_values)
+        
         data_per_enzyme = {}
-        count = 1
-        for enzyme in enzymes:
-            print(f'The data is being assembled and organized ... {count}/425', end = '\r')
+        for count, enzyme in enumerate(enzymes, 1):
+            print(f'The data is being assembled and organized ... {count}/{len(enzymes)}', end = '\r')
+            row_positions = row_groups.get(' '+enzyme, [])
+            positions = measurement_groups.get(' '+enzyme, [])
+            keqs, Keq_values, average_keq, std_keq = statistics('Keq', positions)
+            kms, km_values, average_km, std_km = statistics('Km\'', positions)
+            enthalpies, enthalpy_values, average_enthalpy, std_enthalpy = statistics('Enthalpy [kJ/mol]', positions)
             
-            # lists of the database variables
-            added = False
-            Keq_values, km_values, enthalpy_values, temperatures, phs= [], [], [], [], []
-            references, reactions, kms, enthalpies, keqs = [], [], [], [], []
-            for index, row in df.iterrows():
-                iteration = 1
-                if row['Enzyme:'] == ' '+enzyme:
-                    reactions.append(row['Reaction:'])
-                    references.append('Ibid')
-                    if row['Reference:'] != ' ':
-                        references[-1] = row['Reference:']
-                    
-                    # values are organized into lists
-                    keqs, Keq_values, temperatures, phs, added = assign_values('Keq', keqs, Keq_values, temperatures, phs, added)                        
-                    kms, km_values, temperatures, phs, added = assign_values('Km\'', kms, km_values, temperatures, phs, added)                        
-                    enthalpies, enthalpy_values, temperatures, phs, added = assign_values(
-                        'Enthalpy [kJ/mol]', enthalpies, enthalpy_values, temperatures, phs, added
-                        )                        
-                        
-                    #loop through the unlabeled rows of each enzyme
-                    while iteration + index < len(df) and df.at[index + iteration, 'Enzyme:'] == ' ':
-                        keqs, Keq_values, temperatures, phs, added = assign_values('Keq', keqs, Keq_values, temperatures, phs, added)                        
-                        kms, km_values, temperatures, phs, added = assign_values('Km\'', kms, km_values, temperatures, phs, added)                        
-                        enthalpies, enthalpy_values, temperatures, phs, added = assign_values(
-                            'Enthalpy [kJ/mol]', enthalpies, enthalpy_values, temperatures, phs, added
-                            )         
-                        iteration += 1
-        
-            # statistical processing of scraped values
-            average_keq = std_keq = average_km = std_km = average_enthalpy = std_enthalpy = 'nan' 
-            if len(Keq_values) != 0:
-                average_keq, std_keq = numpy.mean(Keq_values), numpy.std(Keq_values)
-            if len(km_values) != 0:
-                average_km, std_km = numpy.mean(km_values), numpy.std(km_values)
-            if len(enthalpy_values) != 0:
-                average_enthalpy, std_enthalpy = numpy.mean(enthalpy_values), numpy.std(enthalpy_values) 
+            # the conditions are only stated for the first measurement of each enzyme
+            experimental_temperatures, experimental_phs = [], []
+            first_measurement = numpy.flatnonzero(measured[positions])
+            if len(first_measurement):
+                position = positions[first_measurement[0]]
+                experimental_temperatures.append(temperatures[position])
+                experimental_phs.append(phs[position] if phs[position] != ' ' else 'nan')
                 
             #store the information into a nested dictionary structure
-            data_per_enzyme[enzyme] = {'reaction':reactions,
-                                       'experimental temperatures':temperatures,
-                                       'experimental phs':phs,
-                                       'keq reference':references,
+            data_per_enzyme[enzyme] = {'reaction':reactions[row_positions].tolist(),
+                                       'experimental temperatures':experimental_temperatures,
+                                       'experimental phs':experimental_phs,
+                                       'keq reference':[reference if reference != ' ' else 'Ibid' for reference in references[row_positions]],
                                        'Keq':{'keq values in the reference':keqs,
                                               'keqs':Keq_values, 
                                               'keq quantity':len(Keq_values), 
@@ -365,7 +578,6 @@ class TECRDB():
                                                    'enthalpy standard deviation':std_enthalpy
                                                    }
                                       }
-            count += 1
         
         #export the database dictionary as a JSON file
         with open('TECRDB/TECRDB_consolidated.json', 'w') as output:
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Typed columnar storage of the TECRDB tables, with CSV as an export format, and a cached loader of the input datasets
+"""
+from pandas import read_csv, to_numeric, DataFrame, Series
+from pandas.api.types import is_numeric_dtype
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import load_workbook
+from zipfile import ZipFile
+from numpy import nan, array, isnan
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import pyarrow as pa
+import hashlib, json, os
+
+# the numeric fields of the scraped, amalgamated, and merged tables
+numeric_columns = [
+    'T [K]', 'pH', 'Keq', 'Ionic strength [molal]', 'Ionic strength [mol/dm^3]', '-log[Mg+2]', 'Km\'', 'Enthalpy [kJ/mol]',
+    'T(K)', 'pH ', 'K<sub>c</sub>\' ', 'pMg ', 'Km\' ', 'I<sub>c</sub>(mol dm<sup>-3</sup>)', 'I<sub>m</sub>(mol.kg<sup>-1</sup>)',
+    'δ<sub>r</sub>H(cal)/kJ mol<sup>-1</sup>)'
+    ]
+qualifier = ' qualifier'
+
+# render the floats as the text that they were parsed from, where possible
+def _render(values):
+    return values.map(repr).str.replace(r'\.0$', '', regex = True)
+
+# store the numeric fields as floats, and keep the verbatim text of the approximate, uncertain, and non-numeric values in qualifier columns
+def typed_frame(df):
+    # a typed table, like those of read_table, is restored to its text before it is typed again
+    if any(column+qualifier in df for column in df):
+        df = text_frame(df)
+    df = df.copy()
+    for column in df:
+        if column in numeric_columns and is_numeric_dtype(df[column]):
+            # the numeric columns, like the reindexed columns that are absent from every page, have no verbatim text
+            df[column] = df[column].astype('float64')
+            df[column+qualifier] = Series(nan, index = df.index, dtype = 'object')
+            continue
+        text = df[column].astype('object').where(df[column].isna(), df[column].astype(str))
+        if column in numeric_columns:
+            values = to_numeric(text.str.strip(), errors = 'coerce')
+            df[column] = values.astype('float64')
+            df[column+qualifier] = text.where(text.notna() & (_render(values) != text))
+        else:
+            df[column] = text
+    return df
+
+# restore the text of the typed fields, as the CSV is read with dtype = 'object'
+def text_frame(df):
+    df = df.copy()
+    for column in [column for column in df if column+qualifier in df]:
+        qualifiers = df.pop(column+qualifier)
+        df[column] = qualifiers.where(qualifiers.notna(), _render(df[column]).where(df[column].notna()))
+    df = df.astype('object')
+    return df.where(df.notna(), nan)
+
+def write_table(df, path, csv = True):
+    # write the typed table, and optionally the CSV export beside it
+    table = pa.Table.from_pandas(typed_frame(df))
+    if path.endswith('.feather'):
+        feather.write_feather(table, path)
+    else:
+        pq.write_table(table, path)
+    if csv:
+        # the CSV of a typed table carries the verbatim text of its numeric fields
+        typed = any(column+qualifier in df for column in df)
+        (text_frame(df) if typed else df).to_csv(os.path.splitext(path)[0]+'.csv')
+
+def read_table(path, columns = None, typed = True, memory_map = True):
+    # load a stored table, where only the requested columns are read from the memory-mapped file
+    if path.endswith('.csv'):
+        df = read_csv(path, dtype = 'object', index_col = 0)
+        return df if columns is None else df[list(columns)]
+    if columns is not None:
+        columns = list(columns) + [column+qualifier for column in columns if column in numeric_columns and not typed]
+    if path.endswith('.feather'):
+        table = feather.read_table(path, columns = columns, memory_map = memory_map)
+    else:
+        table = pq.read_table(path, columns = columns, memory_map = memory_map)
+    df = table.to_pandas()
+    return df if typed else text_frame(df)
+
+# the process-wide cache of the loaded datasets, keyed by the path, version, and read options of the file
+_datasets = {}
+sidecar_suffix = '.sidecar.parquet'
+
+def _signature(path, read_options):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size, repr(sorted(read_options.items()))]
+
+# each set of read options parses the file into a separate sidecar
+def _sidecar_path(path, signature):
+    return path+'.'+hashlib.md5(signature[-1].encode()).hexdigest()[:8]+sidecar_suffix
+
+def _read_sidecar(path, signature, columns):
+    # the parsed table of a previous run, where the sidecar of another version of the file is ignored
+    sidecar_path = _sidecar_path(path, signature)
+    if not os.path.exists(sidecar_path):
+        return None
+    metadata = pq.read_schema(sidecar_path).metadata or {}
+    if json.loads(metadata.get(b'signature', b'null')) != signature:
+        return None
+    df = pq.read_table(sidecar_path, columns = columns, use_pandas_metadata = True).to_pandas()
+    dtypes = json.loads(metadata[b'dtypes'])
+    df = df.astype({column: dtypes[column] for column in df if column in dtypes})
+    return df.set_axis(df.index.astype(dtypes['index']))
+
+def _write_sidecar(path, signature, df):
+    # columns of mixed types cannot be stored, and are parsed from the CSV on each run
+    try:
+        table = pa.Table.from_pandas(df)
+    except (pa.ArrowException, ValueError):
+        return
+    dtypes = {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+    dtypes['index'] = str(df.index.dtype)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'signature': json.dumps(signature), b'dtypes': json.dumps(dtypes)})
+    _write_parquet(table, _sidecar_path(path, signature))
+
+# the sidecar is skipped on a read-only filesystem
+def _write_parquet(table, path):
+    try:
+        pq.write_table(table, path)
+    except OSError:
+        pass
+
+def _read_csv(path, member = None, **read_options):
+    # stream an archived member straight into the parser, without extracting it
+    if member is None:
+        return read_csv(path, **read_options)
+    with ZipFile(path, 'r') as archive, archive.open(member) as file:
+        return read_csv(file, **read_options)
+
+def load_dataset(path, columns = None, sidecar = True, member = None, **read_options):
+    # load a CSV, or a CSV member of a ZIP archive, once per process and version of the file, where later runs read the parsed table from a Parquet sidecar
+    signature = _signature(path, read_options if member is None else {**read_options, 'member': member})
+    key = (os.path.abspath(path), *signature)
+    projection = None if columns is None else tuple(columns)
+    if (key, projection) not in _datasets:
+        if (key, None) in _datasets:
+            df = _datasets[(key, None)][list(columns)]
+        elif sidecar:
+            df = _read_sidecar(path, signature, None if columns is None else list(columns))
+            if df is None:
+                df = _read_csv(path, member, **read_options)
+                _write_sidecar(path, signature, df)
+                _datasets[(key, None)] = df
+                df = df if columns is None else df[list(columns)]
+        elif 'index_col' not in read_options:
+            df = _read_csv(path, member, usecols = columns, **read_options)
+        else:
+            df = _read_csv(path, member, **read_options)
+            df = df if columns is None else df[list(columns)]
+        _datasets[(key, projection)] = df
+    # the shallow copy protects the cached table from the edits of the caller
+    return _datasets[(key, projection)].copy(deep = False)
+
+def _stream_sheet(path, sheet):
+    # iterate the rows of the read-only sheet once, and collect the header and the values of each column
+    workbook = load_workbook(path, read_only = True)
+    try:
+        rows = workbook[sheet].iter_rows(values_only = True)
+        header = list(next(rows))
+        columns = [[] for column in header]
+        for row in rows:
+            row = row[:len(header)] + (None,)*(len(header)-len(row))
+            for values, value in zip(columns, row):
+                values.append(value)
+    finally:
+        workbook.close()
+    return header, columns
+
+def _typed_column(values):
+    # the numbers of a column as floats, and its text cells beside them
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))) for value in values):
+        raise TypeError('Only the text and numeric cells of a sheet are stored.')
+    numbers = pa.array([value if isinstance(value, (int, float)) else None for value in values], pa.float64())
+    texts = pa.array([value if isinstance(value, str) else None for value in values], pa.string())
+    return numbers, texts
+
+def _untyped_column(numbers, texts):
+    # the cell values, where the integral numbers are restored as the integers that openpyxl parses from the workbook
+    numbers = numbers.to_numpy(zero_copy_only = False)
+    values = array(texts.to_pylist(), dtype = object)
+    integral = ~isnan(numbers) & (numbers == numbers.round())
+    values[integral] = numbers[integral].astype('int64').astype(object)
+    fractional = ~isnan(numbers) & ~integral
+    values[fractional] = numbers[fractional].astype(object)
+    return values
+
+def _sheet_frame(header, columns):
+    df = DataFrame({index: array(values, dtype = object) for index, values in enumerate(columns)})
+    df.columns = header
+    return df
+
+def load_sheet(path, sheet, sidecar = True):
+    # load a workbook sheet once per process and version of the file, where later runs read its typed columns from a Parquet sidecar
+    signature = _signature(path, {'sheet': sheet})
+    key = (os.path.abspath(path), *signature)
+    if key not in _datasets:
+        sidecar_path = _sidecar_path(path, signature)
+        df = None
+        if sidecar and os.path.exists(sidecar_path):
+            table = pq.read_table(sidecar_path)
+            metadata = table.schema.metadata or {}
+            if json.loads(metadata.get(b'signature', b'null')) == signature:
+                header = json.loads(metadata[b'header'])
+                df = _sheet_frame(header, [_untyped_column(table.column(f'{index} numbers'), table.column(f'{index} texts')) for index in range(len(header))])
+        if df is None:
+            header, columns = _stream_sheet(path, sheet)
+            df = _sheet_frame(header, columns)
+            if sidecar:
+                try:
+                    arrays = {}
+                    for index, values in enumerate(columns):
+                        arrays[f'{index} numbers'], arrays[f'{index} texts'] = _typed_column(values)
+                except TypeError:
+                    arrays = None
+                if arrays is not None:
+                    table = pa.table(arrays)
+                    _write_parquet(table.replace_schema_metadata({b'signature': json.dumps(signature), b'header': json.dumps(header)}), sidecar_path)
+        _datasets[key] = df
+    return _datasets[key].copy(deep = False)
+
+def load_members(path, members, workers = 4, sidecar = True):
+    # load several members of a ZIP archive in parallel, where members maps each member to its read options
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {member: pool.submit(load_dataset, path, None, sidecar, member, **read_options) for member, read_options in members.items()}
+    return {member: future.result() for member, future in futures.items()}
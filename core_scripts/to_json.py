@@ -4,128 +4,305 @@ Created on Mon May 17 09:24:58 2022
 
 @author: Andrew Freiburger
 """
-from zipfile import ZipFile, ZIP_LZMA
-from pandas import read_csv
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA
+from hashlib import sha256
+from numpy import where, full
+from warnings import warn
 from glob import glob
-import json, os, re
+from functools import cached_property
+from reactions import reaction_stoichiometry
+from storage import load_dataset
+import json, os
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the reference IDs, like 26QUA/WOO_1205, cannot contain the path separator of the JSON file names
+def _export_name(name, reference):
+    return '_'.join([name, reference]).replace('/', '-')
+
+# serialize a datum with the standard library, or with orjson where it is installed, which indents by two spaces
+def _dumps(datum, serializer = 'json', indent = 4):
+    if serializer == 'orjson':
+        return orjson.dumps(datum, option = orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(datum, indent = indent)
+
+def _serializer(serializer):
+    if serializer == 'orjson' and orjson is None:
+        warn('ImportError: The orjson serializer is not installed, and the standard json module is used.')
+        return 'json'
+    return serializer
+
+# write a chunk of datums in a worker process
+def _write_chunk(directory, chunk, serializer = 'json'):
+    for file_name, datum in chunk:
+        with open(os.path.join(directory, file_name), 'w') as out:
+            out.write(_dumps(datum, serializer))
+    return len(chunk)
+
+# the codecs of the datum archives, where the level applies to deflate and bzip2
+codecs = {'stored': ZIP_STORED, 'deflate': ZIP_DEFLATED, 'bzip2': ZIP_BZIP2, 'lzma': ZIP_LZMA}
+
+def write_archive(archive_path, members, compression = 'lzma', level = None, prune = True):
+    # stream the (name, content) members into the archive, where the manifest of content hashes skips the unchanged members of a rebuild
+    if compression not in codecs:
+        raise ValueError(f'The {compression} compression is not one of {", ".join(codecs)}.')
+    manifest_path = os.path.splitext(archive_path)[0]+'.manifest.json'
+    manifest, rebuild = {}, False
+    if os.path.exists(archive_path):
+        previous = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                previous = json.load(file)
+        if previous and (previous.get('compression'), previous.get('level')) == (compression, level):
+            manifest = previous['members']
+        else:
+            # an archive of another codec or level, or without its manifest, is rebuilt, where the earlier members are kept unless they are pruned
+            rebuild = not prune
+    
+    # append the new members, and defer the changed members that must replace their stale copies
+    hashes, changed, unchanged, kept = {}, {}, 0, {}
+    target = archive_path+'.tmp' if rebuild else archive_path
+    with ZipFile(target, 'a' if manifest else 'w', compression = codecs[compression], compresslevel = level) as _zip:
+        for name, content in members:
+            content = content.encode() if isinstance(content, str) else content
+            hashes[name] = sha256(content).hexdigest()
+            if name not in manifest:
+                _zip.writestr(name, content)
+            elif manifest[name] != hashes[name]:
+                changed[name] = content
+            else:
+                unchanged += 1
+        if rebuild:
+            with ZipFile(archive_path, 'r') as old:
+                for info in old.infolist():
+                    if info.filename not in hashes and info.filename not in kept:
+                        content = old.read(info)
+                        kept[info.filename] = sha256(content).hexdigest()
+                        _zip.writestr(info.filename, content)
+    if rebuild:
+        os.replace(target, archive_path)
+        manifest = kept
+    written = len(hashes) - unchanged
+    removed = [name for name in manifest if name not in hashes] if prune else []
+    if not prune:
+        hashes = {**manifest, **hashes}
+        
+    # rewrite the archive without the stale and removed members
+    if changed or removed:
+        with ZipFile(archive_path, 'r') as old, ZipFile(archive_path+'.tmp', 'w', compression = codecs[compression], compresslevel = level) as new:
+            for info in old.infolist():
+                if info.filename in hashes and info.filename not in changed:
+                    new.writestr(info.filename, old.read(info))
+            for name, content in changed.items():
+                new.writestr(name, content)
+        os.replace(archive_path+'.tmp', archive_path)
+    with open(manifest_path+'.tmp', 'w') as file:
+        json.dump({'compression': compression, 'level': level, 'members': hashes}, file, indent = 1)
+    os.replace(manifest_path+'.tmp', manifest_path)
+    return {'written': written, 'unchanged': unchanged, 'removed': len(removed)}
+
+# compile the template into a constructor of fresh datums, whose leaves are filled from a dictionary of template paths
+def compile_template(template, path = ()):
+    if isinstance(template, dict):
+        children = [(key, compile_template(value, path+(key,))) for key, value in template.items()]
+        def build(values):
+            if path in values:
+                return values[path]
+            return {key: child(values) for key, child in children}
+        return build
+    def leaf(values):
+        value = values.get(path)
+        return template if value is None else value
+    return leaf
+
+# the template paths of the datum fields, and the CSV columns that fill them in order of precedence
+tecr_fields = {
+    ('CuratedMeasurement', 'reference', 'pmid'): ['PMID'],
+    ('CuratedMeasurement', 'reference', 'doi'): ['DOI'],
+    ('CuratedMeasurement', 'reference', 'tecrdb_string'): ['Reference:'],
+    ('CuratedMeasurement', 'reference', 'tecrdb_id'): ['Reference ID:'],
+    ('CuratedMeasurement', 'representative_reaction', 'name'): ['Enzyme:'],
+    ('CuratedMeasurement', 'representative_reaction', 'KEGG'): ['KEGG Reaction:'],
+    ('CuratedMeasurement', 'representative_reaction', 'CID'): ['CID Reaction:'],
+    ('CuratedMeasurement', 'equilibriumConstant'): ['Keq'],
+    ('CuratedMeasurement', 'hydrogenPotential'): ['pH', 'pH '],
+    ('CuratedMeasurement', 'temperature'): ['T [K]'],
+    ('CuratedMeasurement', 'ionicStrength'): ['Ionic strength [molal]', 'Ionic strength [mol/kg]'],
+    ('CuratedMeasurement', 'magnesiumPotential'): ['-log[Mg+2]'],
+    }
+half_rxn_fields = {
+    ('curation', 'comments'): ['comment'],
+    ('CuratedMeasurement', 'reference', 'doi'): ['doi'],
+    ('CuratedMeasurement', 'reference', 'string'): ['reference'],
+    ('CuratedMeasurement', 'compound', 'name'): ['name'],
+    ('CuratedMeasurement', 'hydrogenPotential'): ['p_h'],
+    ('CuratedMeasurement', 'temperature'): ['temperature'],
+    ('CuratedMeasurement', 'ionicStrength'): ['ionic_strength'],
+    ('CuratedMeasurement', 'standard_voltage_prime'): ['standard_E_prime'],
+#    ('CuratedMeasurement', 'equilibriumConstant'): [],  #!!! The equilibrium constant must be calculated from the provided standard voltage
+    }
+curators = {
+    'APF': {'orcid': 'https://orcid.org/0000-0002-7288-535X', 'name': 'Andrew Philip Freiburger'}
+    }
 
 class JSON_datum():
     def __init__(self, csv_path, openTECR_path):
+        self.csv_path = csv_path
         self.openTECR_path = openTECR_path
-        self.csv = read_csv(csv_path).astype(str)
         
-    def tecr_to_json(self, json_template_path, curator = 'APF'):
+    @cached_property
+    def csv(self):
+        # the table is loaded when the first datums are parsed
+        return load_dataset(self.csv_path, dtype = str, keep_default_na = False)
+        
+    def _columns(self, fields):
+        # the stripped column arrays of the datum fields, where the first present column of each field is used
+        columns = {}
+        for path, names in fields.items():
+            for name in names:
+                if name in self.csv:
+                    columns[path] = self.csv[name].str.strip().to_numpy()
+                    break
+        return columns
+    
+    def _datums(self, template, columns, constants):
+        # build a fresh datum from each row of the column arrays, where blank values keep the template default
+        build = compile_template(template)
+        paths = list(columns)
+        for row in zip(*columns.values()):
+            values = dict(constants)
+            values.update((path, value) for path, value in zip(paths, row) if value not in ('', None))
+            yield build(values)
+        
+    def tecr_to_json(self, json_template_path, curator = 'APF', export = 'files', workers = 8, serializer = 'json', chunk_size = 500, compression = 'lzma', level = None):
+        # export each datum as it is parsed, or collect the datums for a batched, NDJSON, or zip export
         with open(json_template_path, 'r') as template:
             json_template = json.load(template)
-        for index, row in self.csv.iterrows():
-            self.template = json_template
-            for key, value in self.template.items():
-                if key == 'curator':
-                    if curator == 'APF':
-                        value['orcid'] = 'https://orcid.org/0000-0002-7288-535X'
-                        value['name'] = 'Andrew Philip Freiburger' 
-                elif key == 'CuratedMeasurement':
-                    # define datum content
-                    value['reference']['pmid'] = row['PMID']
-                    value['reference']['doi'] = row['DOI']
-                    value['reference']['tecrdb_string'] = row['Reference:']
-                    value['reference']['tecrdb_id'] = row['Reference ID:']
-                    value['representative_reaction']['name'] = row['Enzyme:']
-                    value['representative_reaction']['KEGG'] = row['KEGG Reaction:']
-                    value['representative_reaction']['CID'] = row['CID Reaction:']
-
-                    ## population the reaction content
-                    if '=' not in row['Reaction:']:
-                        value['representative_reaction']['stoichiometry'] = row['Reaction:']
-                    else:
-                        reactants, products = row['Reaction:'].split('=')
-                        reactants_dict, products_dict = {}, {}
-                        for reactant in reactants.split(' + '):
-                            stoich = 1
-                            if re.search('\d\s', reactant):
-                                stoich = re.search('\d\s', reactant).group()
-                            reactants_dict[reactant] = stoich
-                        for product in products.split(' + '):
-                            stoich = 1
-                            if re.search('\d\s', product):
-                                stoich = re.search('\d\s', product).group()
-                            products_dict[product] = stoich
-
-                        if value['representative_reaction']['stoichiometry'] != '':
-                            value['representative_reaction']['stoichiometry']['reactants'] = reactants_dict
-                            value['representative_reaction']['stoichiometry']['products'] = products_dict
-
-                # define the measurement data
-                if key == 'equilibriumConstant':
-                    value = row['Keq']
-                elif key == 'hydrogenPotential':
-                    value = row['pH ']
-                elif key == 'temperature':
-                    value = row['T [K]']
-                elif key == 'ionicStrength':
-                    value = row['Ionic strength [mol/kg]']
-                elif key == 'magnesiumPotential' and re.search('(\d+.?\d+) = -log\[Mg\+2\]', str(row['Experimental conditions'])):
-                    value = re.search('(\d+.?\d+) = -log\[Mg\+2\]', str(row['Experimental conditions'])).group()
-
-            self._export(row['Reference ID:'], '', 'tecr')
-        self._export('NIST_TECRDB_JSONs', '', 'tecr')
+        constants = {}
+        if curator in curators:
+            constants.update({('curator', key): value for key, value in curators[curator].items()})
+        columns = self._columns(tecr_fields)
+        
+        # the magnesium potential of the experimental conditions, where the column is blank
+        if 'Experimental conditions' in self.csv:
+            magnesium = self.csv['Experimental conditions'].str.extract(r'(\d+.?\d+) = -log\[Mg\+2\]', expand = False).fillna('').to_numpy()
+            path = ('CuratedMeasurement', 'magnesiumPotential')
+            columns[path] = where(columns[path] != '', columns[path], magnesium) if path in columns else magnesium
+            
+        # the molar ionic strengths of the Noor and Du datums fill the blank molal ionic strengths, and are noted with their unit
+        if 'Ionic strength [mol/dm^3]' in self.csv:
+            molar = self.csv['Ionic strength [mol/dm^3]'].str.strip().to_numpy()
+            path = ('CuratedMeasurement', 'ionicStrength')
+            molal = columns[path] if path in columns else full(len(molar), '', dtype = object)
+            columns[path] = where(molal != '', molal, molar)
+            columns[('curationNotes', 'comments')] = [
+                '' if not molar_value else 'The ionic strength is in mol/dm^3.' if not molal_value else f'The ionic strength is {molar_value} mol/dm^3.'
+                for molal_value, molar_value in zip(molal, molar)]
+            
+        ## populate the reaction content
+        stoichiometries = []
+        for reaction in self.csv['Reaction:'].str.strip():
+            if '=' not in reaction:
+                stoichiometries.append(reaction)
+            else:
+                reactants_dict, products_dict = reaction_stoichiometry(reaction)
+                stoichiometries.append({'reactants': reactants_dict, 'products': products_dict})
+        columns[('CuratedMeasurement', 'representative_reaction', 'stoichiometry')] = stoichiometries
+        
+        datums = self._datums(json_template, columns, constants)
+        if export == 'files':
+            for reference, self.template in zip(self.csv['Reference ID:'], datums):
+                self._export(reference, '', 'tecr')
+            self._export('NIST_TECRDB_JSONs', '', 'tecr')
+        else:
+            names = [_export_name(reference, '') for reference in self.csv['Reference ID:']]
+            self._export_batch(list(zip(names, datums)), 'tecr', 'NIST_TECRDB_JSONs', export, workers, serializer, chunk_size, compression, level)
 
-    def half_rxn_to_json(self, json_template_path, curator = 'APF'):
+    def half_rxn_to_json(self, json_template_path, curator = 'APF', export = 'files', workers = 8, serializer = 'json', chunk_size = 500, compression = 'lzma', level = None):
         with open(json_template_path, 'r') as template:
             json_template = json.load(template)
-        for index, row in self.csv.iterrows():
-            self.template = json_template
-            for key, value in self.template.items():
-                if key == 'curation':
-                    if curator == 'APF':
-                        value['curator']['orcid'] = 'https://orcid.org/0000-0002-7288-535X'
-                        value['curator']['name'] = 'Andrew Philip Freiburger'
-                    value['comments'] = row['comment']
-                elif key == 'CuratedMeasurement': 
-                    # define datum content
-                    value['reference']['doi'] = row['doi']
-                    value['reference']['year'] = re.search('(?<=\()(\d+)(?=\))', row['reference']).group()
-                    value['reference']['string'] = row['reference']
-                    value['compound']['name'] = row['name']
-                    value['hydrogenPotential'] = row['p_h']
-                    value['temperature'] = row['temperature']
-                    value['ionicStrength'] = row['ionic_strength']
-                    value['standard_voltage_prime'] = row['standard_E_prime']
-    #               value['equilibriumConstant'] = value['standard_voltage_prime']  #!!! The equilibrium constant must be calculated from the provided standard voltage
-                    if 'metanetx' in row['CID_red']:
-                        value['compound']['reduced']['MetaNetX']['id'] = row['CID_red']
-                        value['compound']['reduced']['MetaNetX']['charge'] = row['charge_red']
-                        value['compound']['reduced']['MetaNetX']['nH'] = row['nH_red']
-                    if 'pubchem' in row['CID_red']:
-                        value['compound']['reduced']['PubChem']['id'] = row['CID_red']
-                        value['compound']['reduced']['PubChem']['charge'] = row['charge_red']
-                        value['compound']['reduced']['PubChem']['nH'] = row['nH_red']
-                    if 'metanetx' in row['CID_ox']:
-                        value['compound']['oxidized']['MetaNetX']['id'] = row['CID_ox']
-                        value['compound']['oxidized']['MetaNetX']['charge'] = row['charge_ox']
-                        value['compound']['oxidized']['MetaNetX']['nH'] = row['nH_ox']
-                    if 'pubchem' in row['CID_ox']:
-                        value['compound']['oxidized']['PubChem']['id'] = row['CID_ox']
-                        value['compound']['oxidized']['PubChem']['charge'] = row['charge_ox']
-                        value['compound']['oxidized']['PubChem']['nH'] = row['nH_ox']
-
-            self._export(row['name'], row['reference'], 'half_rxns')
-        self._export('Elad_half_rxns', '', 'half_rxns')
+        constants = {}
+        if curator in curators:
+            constants.update({('curation', 'curator', key): value for key, value in curators[curator].items()})
+        columns = self._columns(half_rxn_fields)
+        columns[('CuratedMeasurement', 'reference', 'year')] = self.csv['reference'].str.extract(r'(?<=\()(\d+)(?=\))', expand = False).fillna('').to_numpy()
+        
+        # the identifiers of each redox state, in the database of its compound ID
+        for state, suffix in [('reduced', '_red'), ('oxidized', '_ox')]:
+            for database, prefix in [('MetaNetX', 'metanetx'), ('PubChem', 'pubchem')]:
+                matches = self.csv['CID'+suffix].str.contains(prefix, regex = False).to_numpy()
+                for key, column in [('id', 'CID'), ('charge', 'charge'), ('nH', 'nH')]:
+                    columns[('CuratedMeasurement', 'compound', state, database, key)] = where(matches, self.csv[column+suffix].to_numpy(), '')
+                    
+        datums = self._datums(json_template, columns, constants)
+        if export == 'files':
+            for name, reference, self.template in zip(self.csv['name'], self.csv['reference'], datums):
+                self._export(name, reference, 'half_rxns')
+            self._export('Elad_half_rxns', '', 'half_rxns')
+        else:
+            names = [_export_name(name, reference) for name, reference in zip(self.csv['name'], self.csv['reference'])]
+            self._export_batch(list(zip(names, datums)), 'half_rxns', 'Elad_half_rxns', export, workers, serializer, chunk_size, compression, level)
                     
-    def _export(self, name, reference, data_source, zip_contents = False):
-        export_name = '_'.join([name, reference])
+    def _export(self, name, reference, data_source, zip_contents = False, compression = 'lzma', level = None):
+        export_name = _export_name(name, reference)
         if not zip_contents:
             # export the datum JSON
-            if not os.path.exists(os.path.join(self.openTECR_path, 'datum_points', data_source)):
-                os.mkdir(os.path.join(self.openTECR_path, 'datum_points', data_source))
+            os.makedirs(os.path.join(self.openTECR_path, 'datum_points', data_source), exist_ok = True)
             count = 0
             while os.path.exists(os.path.join(self.openTECR_path, 'datum_points', data_source, export_name+f'{count}.json')):
                 count += 1
             with open(os.path.join(self.openTECR_path, 'datum_points', data_source, export_name+f'{count}.json'), 'w') as out:
                 json.dump(self.template, out, indent = 4)
         else:
-            # zip the set of JSON data
-            with ZipFile(export_name+'.zip', 'a', compression = ZIP_LZMA) as _zip:
-                for file in glob(os.path.join(self.openTECR_path, 'datum_points', data_source, '*.json')):
-                    _zip.write(file)
-                    os.remove(file)
\ No newline at end of file
+            # zip the set of JSON data, where the archived files are removed
+            files = glob(os.path.join(self.openTECR_path, 'datum_points', data_source, '*.json'))
+            def members():
+                for file in files:
+                    with open(file, 'rb') as datum:
+                        yield os.path.join(data_source, os.path.basename(file)), datum.read()
+            write_archive(export_name+'.zip', members(), compression, level, prune = False)
+            for file in files:
+                os.remove(file)
+
+    def _export_batch(self, datums, data_source, archive_name, export, workers = 8, serializer = 'json', chunk_size = 500, compression = 'lzma', level = None):
+        # assign the filenames in memory, numbered after the files that already exist, or by the order of the table for the parallel export
+        serializer = _serializer(serializer)
+        directory = os.path.join(self.openTECR_path, 'datum_points', data_source)
+        os.makedirs(directory, exist_ok = True)
+        existing = set(os.listdir(directory)) if export == 'batched' else set()
+        counts, file_names = {}, []
+        for export_name, datum in datums:
+            count = counts.get(export_name, 0)
+            while export_name+f'{count}.json' in existing:
+                count += 1
+            counts[export_name] = count + 1
+            file_names.append(export_name+f'{count}.json')
+            
+        if export == 'batched':
+            # write the datum JSONs through a thread pool
+            def write(file_name, datum):
+                with open(os.path.join(directory, file_name), 'w') as out:
+                    out.write(_dumps(datum, serializer))
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(write, file_names, [datum for export_name, datum in datums]))
+        elif export == 'parallel':
+            # serialize and write chunks of the table across a process pool
+            named_datums = [(file_name, datum) for file_name, (export_name, datum) in zip(file_names, datums)]
+            chunks = [named_datums[start:start+chunk_size] for start in range(0, len(named_datums), chunk_size)]
+            with ProcessPoolExecutor(workers) as pool:
+                list(pool.map(_write_chunk, [directory]*len(chunks), chunks, [serializer]*len(chunks)))
+        elif export == 'ndjson':
+            # stream one datum per line
+            with open(os.path.join(self.openTECR_path, 'datum_points', archive_name+'.ndjson'), 'w') as out:
+                for export_name, datum in datums:
+                    out.write(_dumps(datum, serializer, None)+'\n')
+        elif export == 'zip':
+            # stream the datums into the archive, without the intermediate files
+            members = ((os.path.join(data_source, file_name), _dumps(datum, serializer)) for file_name, (export_name, datum) in zip(file_names, datums))
+            counts = write_archive(os.path.join(self.openTECR_path, 'datum_points', archive_name+'.zip'), members, compression, level)
+            print(f'{archive_name}.zip: {counts["written"]} written, {counts["unchanged"]} unchanged, {counts["removed"]} removed')
+        else:
+            raise ValueError(f'The {export} export is not one of files, batched, parallel, ndjson, or zip.')